@@ -1 +1,3 @@
 from gym_pacman.envs.pacman_env import PacmanEnv
+from gym_pacman.envs.pacman_vec_env import PacmanVecEnv
+from gym_pacman.envs.pacman_subproc_env import PacmanSubprocVecEnv
@@ -0,0 +1,285 @@
+# batchPacman.py
+# --------------
+# Struct-of-arrays version of the classic rules in pacman.py: B games are
+# stored as NumPy arrays and every agent's turn is applied to all of them at
+# once.  The rules are the same as PacmanRules / GhostRules, turn by turn.
+#
+# Positions are kept in half-cell units (x2), which represents every place a
+# ghost can be at half speed exactly, so distances and nearestPoint need no
+# floating point.  Grids are indexed [game, x, y] like Grid.
+
+import numpy as np
+
+from .game import Directions
+from .pacman import SCARED_TIME, COLLISION_TOLERANCE, TIME_PENALTY, PacmanRules, GhostRules
+
+# Action / direction codes, in the order of PACMAN_ACTIONS in pacman_env
+DIRECTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+NORTH, SOUTH, EAST, WEST, STOP = range(len(DIRECTIONS))
+VECTORS = np.array([(0, 1), (0, -1), (1, 0), (-1, 0), (0, 0)])
+REVERSE = np.array([SOUTH, NORTH, WEST, EAST, STOP])
+
+PACMAN_STEP = int(2 * PacmanRules.PACMAN_SPEED)
+GHOST_STEP = int(2 * GhostRules.GHOST_SPEED)
+SCARED_GHOST_STEP = GHOST_STEP // 2
+KILL_DISTANCE = 2 * COLLISION_TOLERANCE
+
+class BatchGameState:
+    """
+    B games of classic Pacman.  Agent 0 is Pacman, agents 1.. are ghosts;
+    agentMask marks which agents exist in each game (games can have fewer
+    ghosts than the widest one).  Mazes smaller than the largest are padded
+    with walls.
+
+    Arrays (B games, A agents, W x H cells):
+      walls, food, capsules   (B, W, H) bool
+      positions               (B, A, 2) int, half-cell units
+      directions              (B, A) int, index into DIRECTIONS
+      scaredTimers            (B, A) int
+      scores, numFood         (B,) int
+      win, lose               (B,) bool
+      eaten                   (B, A) bool, ghosts eaten since Pacman last moved
+    """
+
+    def __init__( self, walls, food, capsules, agentPositions, agentMask=None ):
+        """
+        walls, food and capsules are (B, W, H) boolean grids and
+        agentPositions (B, A, 2) integer cells with Pacman first.
+        """
+        self.walls = np.array(walls, dtype=bool)
+        B, W, H = self.walls.shape
+        agentPositions = np.asarray(agentPositions)
+        A = agentPositions.shape[1]
+        if agentMask is None:
+            agentMask = np.ones((B, A), dtype=bool)
+        self.numGames, self.numAgents = B, A
+        self.agentMask = np.array(agentMask, dtype=bool)
+        self.startPositions = 2 * agentPositions.astype(np.int32)
+        self.startFood = np.array(food, dtype=bool)
+        self.startCapsules = np.array(capsules, dtype=bool)
+        self.games = np.arange(B)
+
+        self.food = self.startFood.copy()
+        self.capsules = self.startCapsules.copy()
+        self.positions = self.startPositions.copy()
+        self.directions = np.full((B, A), EAST, dtype=np.int8)
+        self.scaredTimers = np.zeros((B, A), dtype=np.int32)
+        self.scores = np.zeros(B, dtype=np.int64)
+        self.numFood = self.food.sum(axis=(1, 2))
+        self.win = np.zeros(B, dtype=bool)
+        self.lose = np.zeros(B, dtype=bool)
+        self.eaten = np.zeros((B, A), dtype=bool)
+
+    def fromLayouts( layouts, numGhostAgents=1000 ):
+        """
+        Builds the batch from a list of Layouts, placing agents the way
+        GameStateData.initialize does.
+        """
+        B = len(layouts)
+        W = max(layout.width for layout in layouts)
+        H = max(layout.height for layout in layouts)
+        walls = np.ones((B, W, H), dtype=bool)
+        food = np.zeros((B, W, H), dtype=bool)
+        capsules = np.zeros((B, W, H), dtype=bool)
+        agents = []
+        for i, layout in enumerate(layouts):
+            walls[i, :layout.width, :layout.height] = layout.walls.data
+            food[i, :layout.width, :layout.height] = layout.food.data
+            for x, y in layout.capsules:
+                capsules[i, x, y] = True
+            positions = []
+            numGhosts = 0
+            for isPacman, pos in layout.agentPositions:
+                if not isPacman:
+                    if numGhosts == numGhostAgents: continue # Max ghosts reached already
+                    else: numGhosts += 1
+                positions.append(pos)
+            agents.append(positions)
+
+        A = max(len(positions) for positions in agents)
+        agentPositions = np.zeros((B, A, 2), dtype=np.int32)
+        agentMask = np.zeros((B, A), dtype=bool)
+        for i, positions in enumerate(agents):
+            agentPositions[i, :len(positions)] = positions
+            agentMask[i, :len(positions)] = True
+        return BatchGameState(walls, food, capsules, agentPositions, agentMask)
+    fromLayouts = staticmethod( fromLayouts )
+
+    def reset( self, games=None ):
+        """
+        Puts the selected games (a boolean mask or indices; all by default)
+        back in their starting state.
+        """
+        if games is None:
+            games = self.games
+        self.food[games] = self.startFood[games]
+        self.capsules[games] = self.startCapsules[games]
+        self.positions[games] = self.startPositions[games]
+        self.directions[games] = EAST
+        self.scaredTimers[games] = 0
+        self.scores[games] = 0
+        self.numFood[games] = self.food[games].sum(axis=(1, 2))
+        self.win[games] = False
+        self.lose[games] = False
+        self.eaten[games] = False
+
+    def isOver( self ):
+        return self.win | self.lose
+
+    def getPositions( self ):
+        """
+        Agent positions in cells, as the reference engine reports them.
+        """
+        return self.positions / 2.0
+
+    ###########
+    # Actions #
+    ###########
+
+    def _possibleActions( self, agentIndex ):
+        """
+        Actions.getPossibleActions for one agent in every game, as a (B, 5)
+        mask over DIRECTIONS.
+        """
+        positions = self.positions[:, agentIndex]
+        cells = (positions + 1) // 2
+        W, H = self.walls.shape[1:]
+        next = cells[:, None, :] + VECTORS[None]
+        inside = (next[..., 0] >= 0) & (next[..., 0] < W) & (next[..., 1] >= 0) & (next[..., 1] < H)
+        blocked = self.walls[self.games[:, None], next[..., 0].clip(0, W - 1), next[..., 1].clip(0, H - 1)]
+        possible = inside & ~blocked
+
+        # In between grid points, all agents must continue straight
+        between = (positions % 2 != 0).any(axis=1)
+        straight = np.arange(len(DIRECTIONS))[None] == self.directions[:, agentIndex, None]
+        possible[between] = straight[between]
+        return possible
+
+    def getLegalPacmanActions( self ):
+        return self._possibleActions(0)
+
+    def getLegalGhostActions( self, ghostIndex ):
+        """
+        Ghosts cannot turn around unless they reach a dead end.
+        """
+        possible = self._possibleActions(ghostIndex)
+        reverse = REVERSE[self.directions[:, ghostIndex]]
+        turn = possible[self.games, reverse] & (possible.sum(axis=1) > 1)
+        possible[self.games[turn], reverse[turn]] = False
+        return possible
+
+    def getRandomGhostActions( self, ghostIndex, rng=np.random ):
+        """
+        A uniformly random legal action per game, like RandomGhost.
+        """
+        legal = self.getLegalGhostActions(ghostIndex)
+        cumulative = legal.cumsum(axis=1)
+        choice = (rng.uniform(size=self.numGames) * cumulative[:, -1]).astype(int)
+        return (cumulative > choice[:, None]).argmax(axis=1)
+
+    def _checkLegal( self, legal, actions, games, agentIndex ):
+        if not legal[games, actions[games]].all():
+            raise Exception("Illegal action for agent %d in games %s" %
+                            (agentIndex, games[~legal[games, actions[games]]]))
+
+    ############
+    # Movement #
+    ############
+
+    def _move( self, agentIndex, actions, games, step ):
+        positions = self.positions[:, agentIndex]
+        positions[games] += VECTORS[actions[games]] * step[:, None]
+        moving = games[actions[games] != STOP] # There is no stop direction
+        self.directions[moving, agentIndex] = actions[moving]
+
+    def applyPacmanActions( self, actions ):
+        """
+        Pacman's turn in every running game; returns the score changes.
+        """
+        actions = np.asarray(actions)
+        games = self.games[~self.isOver()]
+        self._checkLegal(self.getLegalPacmanActions(), actions, games, 0)
+        scoreChange = np.zeros(self.numGames, dtype=np.int64)
+        self.eaten[games] = False
+        self._move(0, actions, games, np.full(len(games), PACMAN_STEP))
+
+        # Eat; Pacman always lands on a grid point
+        x, y = (self.positions[games, 0] // 2).T
+        ateFood = self.food[games, x, y]
+        fed = games[ateFood]
+        self.food[fed, x[ateFood], y[ateFood]] = False
+        self.numFood[fed] -= 1
+        scoreChange[fed] += 10
+        won = fed[self.numFood[fed] == 0]
+        scoreChange[won] += 500
+        self.win[won] = True
+
+        ateCapsule = self.capsules[games, x, y]
+        self.capsules[games[ateCapsule], x[ateCapsule], y[ateCapsule]] = False
+        scared = games[ateCapsule]
+        self.scaredTimers[scared] = np.where(self.agentMask[scared], SCARED_TIME, 0)
+        self.scaredTimers[scared, 0] = 0
+
+        # Time passes
+        scoreChange[games] -= TIME_PENALTY
+
+        # Anyone can kill him
+        for index in range(1, self.numAgents):
+            self._checkDeath(index, games, scoreChange)
+        self.scores += scoreChange
+        return scoreChange
+
+    def applyGhostActions( self, ghostIndex, actions ):
+        """
+        Ghost ghostIndex's turn in every running game that has it; returns the
+        score changes.
+        """
+        actions = np.asarray(actions)
+        games = self.games[~self.isOver() & self.agentMask[:, ghostIndex]]
+        self._checkLegal(self.getLegalGhostActions(ghostIndex), actions, games, ghostIndex)
+        scoreChange = np.zeros(self.numGames, dtype=np.int64)
+        timers = self.scaredTimers[games, ghostIndex]
+        step = np.where(timers > 0, SCARED_GHOST_STEP, GHOST_STEP)
+        self._move(ghostIndex, actions, games, step)
+
+        # Time passes; a ghost that stops being scared snaps to the grid
+        snap = games[timers == 1]
+        self.positions[snap, ghostIndex] = 2 * ((self.positions[snap, ghostIndex] + 1) // 2)
+        self.scaredTimers[games, ghostIndex] = np.maximum(0, timers - 1)
+
+        self._checkDeath(ghostIndex, games, scoreChange)
+        self.scores += scoreChange
+        return scoreChange
+
+    def _checkDeath( self, ghostIndex, games, scoreChange ):
+        games = games[self.agentMask[games, ghostIndex]]
+        distance = np.abs(self.positions[games, ghostIndex] - self.positions[games, 0]).sum(axis=1)
+        games = games[distance <= KILL_DISTANCE]
+
+        scared = self.scaredTimers[games, ghostIndex] > 0
+        eaten = games[scared]
+        scoreChange[eaten] += 200
+        self.positions[eaten, ghostIndex] = self.startPositions[eaten, ghostIndex]
+        self.directions[eaten, ghostIndex] = EAST
+        self.scaredTimers[eaten, ghostIndex] = 0
+        self.eaten[eaten, ghostIndex] = True
+
+        killed = games[~scared & ~self.win[games]]
+        scoreChange[killed] -= 500
+        self.lose[killed] = True
+
+    def step( self, pacmanActions, ghostActions=None, rng=np.random ):
+        """
+        One round, as Game.step plays it: Pacman, then each ghost in turn,
+        skipping games that are over.  ghostActions is a (B, A - 1) array,
+        or None for uniformly random legal ghosts.  Returns the score change
+        of the round.
+        """
+        scoreChange = self.applyPacmanActions(pacmanActions)
+        for index in range(1, self.numAgents):
+            if ghostActions is None:
+                actions = self.getRandomGhostActions(index, rng)
+            else:
+                actions = np.asarray(ghostActions)[:, index - 1]
+            scoreChange += self.applyGhostActions(index, actions)
+        return scoreChange
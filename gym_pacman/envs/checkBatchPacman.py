@@ -0,0 +1,149 @@
+# checkBatchPacman.py
+# -------------------
+# Plays the same games with BatchGameState and with the reference engine
+# (GameState.generateSuccessor), turn by turn, and reports every place the
+# two disagree.  Run it after changing either engine:
+#
+#   python -m gym_pacman.envs.checkBatchPacman -n 100 -r 300
+
+import json
+import os
+import sys
+
+import numpy as np
+
+from .batchPacman import BatchGameState, DIRECTIONS, STOP
+from .layout import getLayout, getRandomLayout
+from .pacman import GameState
+
+CLASSIC_LAYOUTS = ['capsuleClassic', 'contestClassic', 'mediumClassic', 'minimaxClassic',
+                   'openClassic', 'originalClassic', 'smallClassic', 'testClassic',
+                   'trappedClassic', 'trickyClassic', 'smallGrid', 'mediumGrid']
+
+def compareStates( batch, states ):
+    """
+    The differences between game i of batch and states[i], for every game,
+    as a list of strings.
+    """
+    mismatches = []
+    positions = batch.getPositions()
+    for i, state in enumerate(states):
+        data = state.data
+        numAgents = len(data.agentStates)
+        if batch.agentMask[i, numAgents:].any() or not batch.agentMask[i, :numAgents].all():
+            mismatches.append('game %d: agent mask %s for %d agents' % (i, batch.agentMask[i], numAgents))
+            continue
+        for index, agentState in enumerate(data.agentStates):
+            position = tuple(float(v) for v in positions[i, index])
+            if position != tuple(map(float, agentState.getPosition())):
+                mismatches.append('game %d agent %d: position %s, reference %s'
+                                  % (i, index, position, agentState.getPosition()))
+            if DIRECTIONS[batch.directions[i, index]] != agentState.getDirection():
+                mismatches.append('game %d agent %d: direction %s, reference %s'
+                                  % (i, index, DIRECTIONS[batch.directions[i, index]], agentState.getDirection()))
+            if index > 0 and batch.scaredTimers[i, index] != agentState.scaredTimer:
+                mismatches.append('game %d agent %d: scared timer %d, reference %d'
+                                  % (i, index, batch.scaredTimers[i, index], agentState.scaredTimer))
+        width, height = data.food.width, data.food.height
+        if not np.array_equal(batch.food[i, :width, :height], data.food.data):
+            mismatches.append('game %d: food differs' % i)
+        capsules = set((int(x), int(y)) for x, y in zip(*np.nonzero(batch.capsules[i])))
+        if capsules != set(data.capsules):
+            mismatches.append('game %d: capsules %s, reference %s' % (i, sorted(capsules), sorted(data.capsules)))
+        if batch.numFood[i] != state.getNumFood():
+            mismatches.append('game %d: %d food left, reference %d' % (i, batch.numFood[i], state.getNumFood()))
+        if batch.scores[i] != data.score:
+            mismatches.append('game %d: score %d, reference %d' % (i, batch.scores[i], data.score))
+        if batch.win[i] != state.isWin() or batch.lose[i] != state.isLose():
+            mismatches.append('game %d: win/lose %s/%s, reference %s/%s'
+                              % (i, batch.win[i], batch.lose[i], state.isWin(), state.isLose()))
+    return mismatches
+
+def _compareLegal( legal, states, agentIndex ):
+    mismatches = []
+    for i, state in enumerate(states):
+        if state.isWin() or state.isLose() or agentIndex >= state.getNumAgents(): continue
+        reference = set(state.getLegalActions(agentIndex))
+        actions = set(DIRECTIONS[k] for k in np.nonzero(legal[i])[0])
+        if actions != reference:
+            mismatches.append('game %d agent %d: legal actions %s, reference %s'
+                              % (i, agentIndex, sorted(actions), sorted(reference)))
+    return mismatches
+
+def _chooseActions( legal, states, agentIndex, rng ):
+    """
+    A random legal action per game; the reference states that take a turn
+    are replaced by their successors.
+    """
+    actions = np.full(len(states), STOP)
+    for i, state in enumerate(states):
+        if state.isWin() or state.isLose() or agentIndex >= state.getNumAgents(): continue
+        actions[i] = rng.choice(np.nonzero(legal[i])[0])
+        states[i] = state.generateSuccessor(agentIndex, DIRECTIONS[actions[i]])
+    return actions
+
+def runComparison( layouts, rounds, seed=0, numGhostAgents=5 ):
+    """
+    Plays the layouts for up to rounds rounds of random legal moves in both
+    engines, comparing legal actions before every turn and the whole state
+    after it.  Returns the list of mismatches (empty when the engines
+    agree).
+    """
+    rng = np.random.RandomState(seed)
+    states = []
+    for layout in layouts:
+        state = GameState()
+        state.initialize(layout, numGhostAgents)
+        states.append(state)
+    batch = BatchGameState.fromLayouts(layouts, numGhostAgents)
+    mismatches = compareStates(batch, states)
+
+    for round in range(rounds):
+        if mismatches or all(state.isWin() or state.isLose() for state in states): break
+        legal = batch.getLegalPacmanActions()
+        mismatches += _compareLegal(legal, states, 0)
+        if mismatches: break
+        batch.applyPacmanActions(_chooseActions(legal, states, 0, rng))
+        mismatches += compareStates(batch, states)
+        for index in range(1, batch.numAgents):
+            if mismatches: break
+            legal = batch.getLegalGhostActions(index)
+            mismatches += _compareLegal(legal, states, index)
+            if mismatches: break
+            batch.applyGhostActions(index, _chooseActions(legal, states, index, rng))
+            mismatches += compareStates(batch, states)
+    return ['round %d: %s' % (round, mismatch) for mismatch in mismatches]
+
+def readCommand( argv ):
+    from optparse import OptionParser
+    usageStr = """
+    USAGE:      python -m gym_pacman.envs.checkBatchPacman <options>
+    EXAMPLE:    python -m gym_pacman.envs.checkBatchPacman -n 100 -r 300
+                    - checks 100 random layouts and the classic ones for 300 rounds
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-n', '--numLayouts', dest='numLayouts', type='int',
+                      help='the number of random layouts to play', default=100)
+    parser.add_option('-r', '--rounds', dest='rounds', type='int',
+                      help='the most rounds each game is played for', default=300)
+    parser.add_option('-s', '--seed', dest='seed', type='int',
+                      help='seed for the layouts and the moves', default=0)
+    parser.add_option('-p', '--params', dest='params',
+                      help='the layout_params JSON FILE', metavar='FILE',
+                      default=os.path.join(os.path.dirname(__file__), '..', '..', 'layout_params.json'))
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+if __name__ == '__main__':
+    options = readCommand( sys.argv[1:] )
+    layoutParams = json.load(open(options.params))
+    rng = np.random.RandomState(options.seed)
+    layouts = [getRandomLayout(layoutParams, rng) for _ in range(options.numLayouts)]
+    layouts += [getLayout(name) for name in CLASSIC_LAYOUTS]
+    mismatches = runComparison(layouts, options.rounds, options.seed)
+    for mismatch in mismatches[:20]:
+        print(mismatch)
+    print('%d layouts, %d mismatches' % (len(layouts), len(mismatches)))
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,94 @@
+# checkFeatureExtractors.py
+# -------------------------
+# Checks featureExtractors.closestFood, with each of its lookups, against a
+# plain breadth-first search over random food grids on the classic and
+# random layouts, and reports every cell where they disagree.  Run it after changing closestFood:
+#
+#   python -m gym_pacman.envs.checkFeatureExtractors -n 20
+
+import json
+import os
+import sys
+
+import numpy as np
+
+from .checkBatchPacman import CLASSIC_LAYOUTS
+from .featureExtractors import closestFood
+from .layout import getLayout, getRandomLayout
+
+def searchClosestFood( pos, food, walls ):
+    """
+    The maze distance from pos to the nearest food, by breadth-first search
+    over the walls alone, or None when no food can be reached.
+    """
+    frontier, seen, dist = [pos], set([pos]), 0
+    while frontier:
+        nextFrontier = []
+        for x, y in frontier:
+            if food[x][y]: return dist
+            for nx, ny in ((x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)):
+                if 0 <= nx < walls.width and 0 <= ny < walls.height and not walls[nx][ny] and (nx, ny) not in seen:
+                    seen.add((nx, ny))
+                    nextFrontier.append((nx, ny))
+        frontier, dist = nextFrontier, dist + 1
+    return None
+
+def runComparison( layouts, seed=0, numFoodGrids=3 ):
+    """
+    For every open cell of every layout, under numFoodGrids random thinnings
+    of the layout's food, compares closestFood with no lookups, with the
+    layout's ActionTable and with its MazeDistances against
+    searchClosestFood.  Returns the list of mismatches (empty when they
+    agree).
+    """
+    rng = np.random.RandomState(seed)
+    mismatches = []
+    for i, layout in enumerate(layouts):
+        walls = layout.walls
+        table = layout.getActionTable()
+        distances = layout.getMazeDistances()
+        for k in range(numFoodGrids):
+            food = layout.food.copy()
+            food.data &= rng.rand(*food.data.shape) < rng.rand()
+            for pos in layout.walls.asList(False):
+                reference = searchClosestFood(pos, food, walls)
+                results = [('no lookups', closestFood(pos, food, walls)),
+                           ('action table', closestFood(pos, food, walls, table)),
+                           ('distances', closestFood(pos, food, walls, distances=distances))]
+                for name, result in results:
+                    if result != reference:
+                        mismatches.append('layout %d food %d cell %s: %s gives %s, reference %s'
+                                          % (i, k, pos, name, result, reference))
+    return mismatches
+
+def readCommand( argv ):
+    from optparse import OptionParser
+    usageStr = """
+    USAGE:      python -m gym_pacman.envs.checkFeatureExtractors <options>
+    EXAMPLE:    python -m gym_pacman.envs.checkFeatureExtractors -n 20
+                    - checks 20 random layouts and the classic ones
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-n', '--numLayouts', dest='numLayouts', type='int',
+                      help='the number of random layouts to check', default=20)
+    parser.add_option('-s', '--seed', dest='seed', type='int',
+                      help='seed for the layouts and the food', default=0)
+    parser.add_option('-p', '--params', dest='params',
+                      help='the layout_params JSON FILE', metavar='FILE',
+                      default=os.path.join(os.path.dirname(__file__), '..', '..', 'layout_params.json'))
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+if __name__ == '__main__':
+    options = readCommand( sys.argv[1:] )
+    layoutParams = json.load(open(options.params))
+    rng = np.random.RandomState(options.seed)
+    layouts = [getRandomLayout(layoutParams, rng) for _ in range(options.numLayouts)]
+    layouts += [getLayout(name) for name in CLASSIC_LAYOUTS]
+    mismatches = runComparison(layouts, options.seed)
+    for mismatch in mismatches[:20]:
+        print(mismatch)
+    print('%d layouts, %d mismatches' % (len(layouts), len(mismatches)))
+    sys.exit(1 if mismatches else 0)
@@ -14,8 +14,9 @@
 
 "Feature extractors for Pacman game states"
 
-from game import Directions, Actions
-import util
+from .game import Directions, Actions
+from .mazeDistances import UNREACHABLE
+from . import util
 
 class FeatureExtractor:
     def getFeatures(self, state, action):
@@ -41,11 +42,21 @@ class CoordinateExtractor(FeatureExtractor):
         feats['action=%s' % action] = 1.0
         return feats
 
-def closestFood(pos, food, walls):
+def closestFood(pos, food, walls, table=None, distances=None):
     """
     closestFood -- this is similar to the function that we have
     worked on in the search project; here its all in one place
+
+    table is the layout's ActionTable and distances its MazeDistances, if
+    there are any; with distances no search is needed.
     """
+    if distances is not None and not walls[pos[0]][pos[1]]:
+        reachable = distances.distancesFrom(pos)[food.data]
+        reachable = reachable[reachable != UNREACHABLE]
+        if len(reachable) == 0:
+            return None
+        return int(reachable.min())
+
     fringe = [(pos[0], pos[1], 0)]
     expanded = set()
     while fringe:
@@ -57,7 +68,7 @@ def closestFood(pos, food, walls):
         if food[pos_x][pos_y]:
             return dist
         # otherwise spread out from the location to its neighbours
-        nbrs = Actions.getLegalNeighbors((pos_x, pos_y), walls)
+        nbrs = Actions.getLegalNeighbors((pos_x, pos_y), walls, table)
         for nbr_x, nbr_y in nbrs:
             fringe.append((nbr_x, nbr_y, dist+1))
     # no food found
@@ -77,6 +88,8 @@ class SimpleExtractor(FeatureExtractor):
         food = state.getFood()
         walls = state.getWalls()
         ghosts = state.getGhostPositions()
+        table = state.data.layout.getActionTable()
+        distances = state.data.layout.getMazeDistances()
 
         features = util.Counter()
 
@@ -88,13 +101,13 @@ class SimpleExtractor(FeatureExtractor):
         next_x, next_y = int(x + dx), int(y + dy)
 
         # count the number of ghosts 1-step away
-        features["#-of-ghosts-1-step-away"] = sum((next_x, next_y) in Actions.getLegalNeighbors(g, walls) for g in ghosts)
+        features["#-of-ghosts-1-step-away"] = sum((next_x, next_y) in Actions.getLegalNeighbors(g, walls, table) for g in ghosts)
 
         # if there is no danger of ghosts then add the food feature
         if not features["#-of-ghosts-1-step-away"] and food[next_x][next_y]:
             features["eats-food"] = 1.0
 
-        dist = closestFood((next_x, next_y), food, walls)
+        dist = closestFood((next_x, next_y), food, walls, table, distances)
         if dist is not None:
             # make the distance a number less than one otherwise the update
             # will diverge wildly
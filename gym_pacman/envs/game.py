@@ -21,6 +21,7 @@
 # For more info, see http://inst.eecs.berkeley.edu/~cs188/sp09/pacman.html
 
 from .util import *
+import numpy as np
 import time, os
 import traceback
 import sys
@@ -75,6 +76,8 @@ class Configuration:
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
     """
+    # One is made for every move, so no per-instance __dict__
+    __slots__ = ('pos', 'direction')
 
     def __init__(self, pos, direction):
         self.pos = pos
@@ -121,6 +124,7 @@ class AgentState:
     """
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
     """
+    __slots__ = ('start', 'configuration', 'isPacman', 'scaredTimer', 'numCarrying', 'numReturned')
 
     def __init__( self, startConfiguration, isPacman ):
         self.start = startConfiguration
@@ -161,9 +165,10 @@ class AgentState:
 
 class Grid:
     """
-    A 2-dimensional array of objects backed by a list of lists.  Data is accessed
-    via grid[x][y] where (x,y) are positions on a Pacman map with x horizontal,
-    y vertical and the origin (0,0) in the bottom left corner.
+    A 2-dimensional array of booleans backed by a NumPy bool array.  Data is
+    accessed via grid[x][y] where (x,y) are positions on a Pacman map with x
+    horizontal, y vertical and the origin (0,0) in the bottom left corner;
+    grid[x] is a view of column x, so grid[x][y] = value writes through.
 
     The __str__ method constructs an output that is oriented like a pacman board.
     """
@@ -173,7 +178,7 @@ class Grid:
 
         self.width = width
         self.height = height
-        self.data = [[initialValue for y in range(height)] for x in range(width)]
+        self.data = np.full((width, height), initialValue, dtype=bool)
         if bitRepresentation:
             self._unpackBits(bitRepresentation)
 
@@ -190,41 +195,34 @@ class Grid:
 
     def __eq__(self, other):
         if other == None: return False
-        return self.data == other.data
+        return np.array_equal(self.data, other.data)
 
     def __hash__(self):
-        # return hash(str(self))
-        base = 1
-        h = 0
-        for l in self.data:
-            for i in l:
-                if i:
-                    h += base
-                base *= 2
-        return hash(h)
+        return hash(np.packbits(self.data).tobytes())
+
+    def _withData(self, data):
+        # a Grid of the same size around data, without filling a new array
+        g = Grid.__new__(Grid)
+        g.CELLS_PER_INT = self.CELLS_PER_INT
+        g.width = self.width
+        g.height = self.height
+        g.data = data
+        return g
 
     def copy(self):
-        g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
-        return g
+        return self._withData(self.data.copy())
 
     def deepCopy(self):
         return self.copy()
 
     def shallowCopy(self):
-        g = Grid(self.width, self.height)
-        g.data = self.data
-        return g
+        return self._withData(self.data)
 
     def count(self, item =True ):
-        return sum([x.count(item) for x in self.data])
+        return int(np.count_nonzero(self.data == item))
 
     def asList(self, key = True):
-        list = []
-        for x in range(self.width):
-            for y in range(self.height):
-                if self[x][y] == key: list.append( (x,y) )
-        return list
+        return [tuple(cell) for cell in np.argwhere(self.data == key).tolist()]
 
     def packBits(self):
         """
@@ -232,21 +230,18 @@ class Grid:
 
         (width, height, bitPackedInts...)
         """
-        bits = [self.width, self.height]
-        currentInt = 0
-        for i in range(self.height * self.width):
-            bit = self.CELLS_PER_INT - (i % self.CELLS_PER_INT) - 1
-            x, y = self._cellIndexToPosition(i)
-            if self[x][y]:
-                currentInt += 2 ** bit
-            if (i + 1) % self.CELLS_PER_INT == 0:
-                bits.append(currentInt)
-                currentInt = 0
-        bits.append(currentInt)
-        return tuple(bits)
+        # Cells in x-major order, CELLS_PER_INT to an int, first cell in the
+        # highest bit; the last, partial int is always present
+        cells = self.width * self.height
+        numInts = cells // self.CELLS_PER_INT + 1
+        flat = np.zeros(numInts * self.CELLS_PER_INT, dtype=np.int64)
+        flat[:cells] = self.data.ravel()
+        weights = 2 ** np.arange(self.CELLS_PER_INT - 1, -1, -1, dtype=np.int64)
+        packed = flat.reshape(numInts, self.CELLS_PER_INT).dot(weights)
+        return tuple([self.width, self.height] + packed.tolist())
 
     def _cellIndexToPosition(self, index):
-        x = index / self.height
+        x = index // self.height
         y = index % self.height
         return x, y
 
@@ -254,25 +249,12 @@ class Grid:
         """
         Fills in data from a bit-level representation
         """
-        cell = 0
-        for packed in bits:
-            for bit in self._unpackInt(packed, self.CELLS_PER_INT):
-                if cell == self.width * self.height: break
-                x, y = self._cellIndexToPosition(cell)
-                self[x][y] = bit
-                cell += 1
-
-    def _unpackInt(self, packed, size):
-        bools = []
-        if packed < 0: raise ValueError("must be a positive integer")
-        for i in range(size):
-            n = 2 ** (self.CELLS_PER_INT - i - 1)
-            if packed >= n:
-                bools.append(True)
-                packed -= n
-            else:
-                bools.append(False)
-        return bools
+        packed = np.array(bits, dtype=np.int64)
+        if (packed < 0).any(): raise ValueError("must be a positive integer")
+        shifts = np.arange(self.CELLS_PER_INT - 1, -1, -1, dtype=np.int64)
+        cells = ((packed[:, None] >> shifts) & 1).ravel().astype(bool)
+        count = min(len(cells), self.width * self.height)
+        self.data.ravel()[:count] = cells[:count]
 
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
@@ -329,7 +311,7 @@ class Actions:
         return (dx * speed, dy * speed)
     directionToVector = staticmethod(directionToVector)
 
-    def getPossibleActions(config, walls):
+    def getPossibleActions(config, walls, table=None):
         possible = []
         x, y = config.pos
         x_int, y_int = int(x + 0.5), int(y + 0.5)
@@ -338,6 +320,9 @@ class Actions:
         if (abs(x - x_int) + abs(y - y_int)  > Actions.TOLERANCE):
             return [config.getDirection()]
 
+        if table is not None and table.contains(x_int, y_int):
+            return list(table.actions[x_int][y_int])
+
         for dir, vec in Actions._directionsAsList:
             dx, dy = vec
             next_y = y_int + dy
@@ -349,9 +334,11 @@ class Actions:
 
     getPossibleActions = staticmethod(getPossibleActions)
 
-    def getLegalNeighbors(position, walls):
+    def getLegalNeighbors(position, walls, table=None):
         x,y = position
         x_int, y_int = int(x + 0.5), int(y + 0.5)
+        if table is not None and table.contains(x_int, y_int):
+            return list(table.neighbors[x_int][y_int])
         neighbors = []
         for dir, vec in Actions._directionsAsList:
             dx, dy = vec
@@ -369,9 +356,52 @@ class Actions:
         return (x + dx, y + dy)
     getSuccessor = staticmethod(getSuccessor)
 
-class GameStateData:
+class ActionTable:
+    """
+    The legal directions and neighbouring cells of every grid point of a
+    walls Grid, as Actions.getPossibleActions and Actions.getLegalNeighbors
+    work them out.  Walls don't change during a game, so a layout builds
+    its table once (see Layout.getActionTable) and the lookups replace the
+    wall checks.
+    """
+    def __init__(self, walls):
+        self.width = walls.width
+        self.height = walls.height
+        self.actions = [[tuple(Actions.getPossibleActions(Configuration((x, y), Directions.STOP), walls))
+                         for y in range(self.height)] for x in range(self.width)]
+        self.neighbors = [[tuple(Actions.getLegalNeighbors((x, y), walls))
+                           for y in range(self.height)] for x in range(self.width)]
+
+    def contains(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+ZOBRIST_KEYS = {}
+SCORE_KEY = 0x9E3779B97F4A7C15
+
+def getZobristKeys( width, height ):
+    """
+    Random 63-bit food and capsule keys for every cell of a width x height
+    board, as lists indexed [x][y]; fixed per board size.
     """
+    if (width, height) not in ZOBRIST_KEYS:
+        rng = np.random.RandomState([width, height])
+        keys = rng.randint(0, 2**63 - 1, size=(2, width, height), dtype=np.int64)
+        ZOBRIST_KEYS[(width, height)] = (keys[0].tolist(), keys[1].tolist())
+    return ZOBRIST_KEYS[(width, height)]
 
+class GameStateData:
+    """
+    Successors share the food grid, capsule list, agent states and eaten
+    flags of their predecessor until they change them: write through
+    getMutableAgentState, getMutableCapsules and getMutableEaten (or eatFood
+    and eatCapsule), never through the shared objects.
+
+    The hash is kept up to date as the state changes: the Zobrist keys of
+    the remaining food and capsules XORed together, XOR a hash per agent,
+    XOR the score.  An agent's term is taken out when getMutableAgentState
+    hands it out and put back, recomputed, at the next __hash__.  Agent
+    terms hash their direction strings, so like any str hash the state
+    hash differs between processes (see PYTHONHASHSEED).
     """
     def __init__( self, prevState = None ):
         """
@@ -379,11 +409,23 @@ class GameStateData:
         """
         if prevState != None:
             self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            self.capsules = prevState.capsules
+            # Kept up to date by the rules as food and capsules are eaten
+            self.numFood = prevState.numFood
+            self.numCapsules = prevState.numCapsules
+            self.agentStates = prevState.agentStates
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            prevState._updateAgentHash()
+            self._boardHash = prevState._boardHash
+            self._agentHash = prevState._agentHash
+            self._agentHashes = prevState._agentHashes
+        self._changedAgents = []
+        # What this packet has copied from its predecessor so far
+        self._ownCapsules = False
+        self._ownEaten = False
+        self._ownAgentStates = None # per agent, once the list is copied
 
         self._foodEaten = None
         self._foodAdded = None
@@ -396,6 +438,12 @@ class GameStateData:
     def deepCopy( self ):
         state = GameStateData( self )
         state.food = self.food.deepCopy()
+        state.capsules = self.capsules[:]
+        state.agentStates = self.copyAgentStates( self.agentStates )
+        state._agentHashes = self._agentHashes[:]
+        state._eaten = self._eaten[:]
+        state._ownCapsules = state._ownEaten = True
+        state._ownAgentStates = [True for a in state.agentStates]
         state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
@@ -409,12 +457,63 @@ class GameStateData:
             copiedStates.append( agentState.copy() )
         return copiedStates
 
+    def getMutableAgentState( self, agentIndex ):
+        """
+        The AgentState of agentIndex, copied first if it is still shared
+        with the predecessor.
+        """
+        if self._ownAgentStates is None:
+            self.agentStates = self.agentStates[:]
+            self._agentHashes = self._agentHashes[:]
+            self._ownAgentStates = [False for a in self.agentStates]
+        if not self._ownAgentStates[agentIndex]:
+            self.agentStates[agentIndex] = self.agentStates[agentIndex].copy()
+            self._ownAgentStates[agentIndex] = True
+        if self._agentHashes[agentIndex] is not None:
+            self._agentHash ^= self._agentHashes[agentIndex]
+            self._agentHashes[agentIndex] = None
+            self._changedAgents.append( agentIndex )
+        return self.agentStates[agentIndex]
+
+    def getMutableCapsules( self ):
+        if not self._ownCapsules:
+            self.capsules = self.capsules[:]
+            self._ownCapsules = True
+        return self.capsules
+
+    def getMutableEaten( self ):
+        if not self._ownEaten:
+            self._eaten = self._eaten[:]
+            self._ownEaten = True
+        return self._eaten
+
+    def eatFood( self, position ):
+        x, y = position
+        self.food = self.food.copy()
+        self.food[x][y] = False
+        self.numFood -= 1
+        self._boardHash ^= getZobristKeys( self.layout.width, self.layout.height )[0][x][y]
+
+    def eatCapsule( self, position ):
+        x, y = position
+        self.getMutableCapsules().remove( position )
+        self.numCapsules -= 1
+        self._boardHash ^= getZobristKeys( self.layout.width, self.layout.height )[1][x][y]
+
+    def _updateAgentHash( self ):
+        for agentIndex in self._changedAgents:
+            term = hash( (agentIndex, self.agentStates[agentIndex]) )
+            self._agentHashes[agentIndex] = term
+            self._agentHash ^= term
+        self._changedAgents = []
+
     def __eq__( self, other ):
         """
         Allows two states to be compared.
         """
         if other == None: return False
         # TODO Check for type of other
+        if hash( self ) != hash( other ): return False
         if not self.agentStates == other.agentStates: return False
         if not self.food == other.food: return False
         if not self.capsules == other.capsules: return False
@@ -425,13 +524,8 @@ class GameStateData:
         """
         Allows states to be keys of dictionaries.
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError as e:
-                print(e)
-                #hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+        self._updateAgentHash()
+        return self._boardHash ^ self._agentHash ^ (hash( self.score ) * SCORE_KEY)
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
@@ -492,6 +586,8 @@ class GameStateData:
         self.food = layout.food.copy()
         #self.capsules = []
         self.capsules = layout.capsules[:]
+        self.numFood = layout.totalFood
+        self.numCapsules = len(self.capsules)
         self.layout = layout
         self.score = 0
         self.scoreChange = 0
@@ -504,6 +600,39 @@ class GameStateData:
                 else: numGhosts += 1
             self.agentStates.append( AgentState( Configuration( pos, Directions.EAST), isPacman) )
         self._eaten = [False for a in self.agentStates]
+        self._ownCapsules = self._ownEaten = True
+        self._ownAgentStates = [True for a in self.agentStates]
+
+        foodKeys, capsuleKeys = getZobristKeys( layout.width, layout.height )
+        self._boardHash = 0
+        for x, y in zip( *np.nonzero( self.food.data ) ):
+            self._boardHash ^= foodKeys[x][y]
+        for x, y in self.capsules:
+            self._boardHash ^= capsuleKeys[x][y]
+        self._agentHash = 0
+        self._agentHashes = [None for a in self.agentStates]
+        self._changedAgents = list( range( len( self.agentStates ) ) )
+
+class StateView:
+    """
+    What Game.step hands trusted agents instead of the state: reads go to the
+    state, assignments raise, and state.data is a StateView too.  Getters
+    still return the game's own objects (AgentStates, Grids, the layout),
+    which trusted agents must not modify.
+    """
+    __slots__ = ('_state',)
+
+    def __init__( self, state ):
+        object.__setattr__( self, '_state', state )
+
+    def __getattr__( self, name ):
+        value = getattr( self._state, name )
+        if name == 'data':
+            return StateView( value )
+        return value
+
+    def __setattr__( self, name, value ):
+        raise Exception('Trusted agents may not modify the game state (set %s)' % name)
 
 try:
     import boinc
@@ -739,6 +868,15 @@ class Game:
         agentIndex = self.startingIndex
         numAgents = len( self.agents )
 
+        # Resolve what each agent supports once, rather than every step.
+        # Agents whose own class sets trusted = True (the built-in ghosts, not
+        # their subclasses) only read the state and never print or hang, so
+        # step passes them a StateView of the live state without a copy,
+        # mute or timer; they must not modify anything reached through it.
+        self.agentObserves = ['observationFunction' in dir( agent ) for agent in self.agents]
+        self.agentTrusted = [type( agent ).__dict__.get( 'trusted', False ) and not observes
+                             for agent, observes in zip( self.agents, self.agentObserves )]
+
         for i in range(1, len(self.agents)): # ignore pacman
             agent = self.agents[i]
             if not agent:
@@ -794,8 +932,17 @@ class Game:
                 # Generate an observation of the state
                 if agentIndex == 0: # pacman
                     action = pacman_action # action already specified, go directly to execute 
+                elif self.agentTrusted[agentIndex]:
+                    if self.catchExceptions:
+                        try:
+                            action = agent.getAction( StateView( self.state ) )
+                        except Exception as data:
+                            self._agentCrash(agentIndex)
+                            return
+                    else:
+                        action = agent.getAction( StateView( self.state ) )
                 else: # for ghosts, follow Berkeley AI code
-                    if 'observationFunction' in dir( agent ):
+                    if self.agentObserves[agentIndex]:
                         self.mute(agentIndex)
                         if self.catchExceptions:
                             try:
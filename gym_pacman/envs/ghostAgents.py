@@ -17,6 +17,12 @@ import random
 from .util import manhattanDistance, raiseNotDefined, chooseFromDistribution, Counter
 
 class GhostAgent( Agent ):
+    """
+    A ghost whose class sets trusted = True is handed a game.StateView of the
+    live game state by Game.step, not a copy: its getAction must only read
+    the state and what it returns (agent states, grids, the layout), never
+    modify them.  Subclasses are not trusted unless they set it themselves.
+    """
     def __init__( self, index ):
         self.index = index
 
@@ -33,6 +39,7 @@ class GhostAgent( Agent ):
 
 class RandomGhost( GhostAgent ):
     "A ghost that chooses a legal action uniformly at random."
+    trusted = True # only reads the state; see GhostAgent
     def getDistribution( self, state ):
         dist = Counter()
         for a in state.getLegalActions( self.index ): dist[a] = 1.0
@@ -40,11 +47,18 @@ class RandomGhost( GhostAgent ):
         return dist
 
 class DirectionalGhost( GhostAgent ):
-    "A ghost that prefers to rush Pacman, or flee when scared."
-    def __init__( self, index, prob_attack=0.8, prob_scaredFlee=0.8 ):
+    """
+    A ghost that prefers to rush Pacman, or flee when scared.  Distances are
+    Manhattan unless useMazeDistance is set, in which case they follow the
+    maze (see Layout.getMazeDistances).
+    """
+    trusted = True # only reads the state; see GhostAgent
+
+    def __init__( self, index, prob_attack=0.8, prob_scaredFlee=0.8, useMazeDistance=False ):
         self.index = index
         self.prob_attack = prob_attack
         self.prob_scaredFlee = prob_scaredFlee
+        self.useMazeDistance = useMazeDistance
 
     def getDistribution( self, state ):
         # Read variables from state
@@ -63,7 +77,11 @@ class DirectionalGhost( GhostAgent ):
         pacmanPosition = state.getPacmanPosition()
 
         # Select best actions given the state
-        distancesToPacman = [manhattanDistance( pos, pacmanPosition ) for pos in newPositions]
+        if self.useMazeDistance:
+            distances = state.data.layout.getMazeDistances()
+            distancesToPacman = [distances.distance( pos, pacmanPosition ) for pos in newPositions]
+        else:
+            distancesToPacman = [manhattanDistance( pos, pacmanPosition ) for pos in newPositions]
         if len(distancesToPacman) == 0:
             import pdb
             pdb.set_trace()
@@ -13,8 +13,11 @@
 
 
 from .graphicsUtils import *
+from .numpyGraphicsUtils import NumpyGraphicsUtils
 import math, time
+from collections import OrderedDict
 from .game import Directions
+from .util import nearestPoint
 
 ###########################
 #  GRAPHICS DISPLAY CODE  #
@@ -79,6 +82,95 @@ CAPSULE_SIZE = 0.25
 # Drawing walls
 WALL_RADIUS = 0.15
 
+# Rasterised static layers (walls, and optionally the initial food), keyed by
+# layout text and drawing parameters, least recently used first
+BACKGROUND_CACHE = OrderedDict()
+BACKGROUND_CACHE_SIZE = 64
+
+# Sprite atlases, keyed by grid size and capture flag
+SPRITE_ATLASES = {}
+MOUTH_PHASES = 8 # Pacman mouth openings pre-rendered per direction
+SUBPIXEL_STEPS = 4 # Sprite placements are rounded to this fraction of a pixel
+
+# Shapes of the items that move or get eaten, drawn with any graphicsUtils;
+# shared by PacmanGraphics and the SpriteAtlas tiles
+def getEndpoints(direction, position=(0,0)):
+    x, y = position
+    pos = x - int(x) + y - int(y)
+    width = 30 + 80 * math.sin(math.pi* pos)
+
+    delta = width / 2
+    if (direction == 'West'):
+        endpoints = (180+delta, 180-delta)
+    elif (direction == 'North'):
+        endpoints = (90+delta, 90-delta)
+    elif (direction == 'South'):
+        endpoints = (270+delta, 270-delta)
+    else:
+        endpoints = (0+delta, 0-delta)
+    return endpoints
+
+def drawPacmanShape(graphicsUtils, screen_point, endpoints, index, gridSize, capture=False):
+    width = PACMAN_OUTLINE_WIDTH
+    outlineColor = PACMAN_COLOR
+    fillColor = PACMAN_COLOR
+
+    if capture:
+        outlineColor = TEAM_COLORS[index % 2]
+        fillColor = GHOST_COLORS[index]
+        width = PACMAN_CAPTURE_OUTLINE_WIDTH
+
+    return [graphicsUtils.circle(screen_point, PACMAN_SCALE * gridSize,
+                   fillColor = fillColor, outlineColor = outlineColor,
+                   endpoints = endpoints,
+                   width = width)]
+
+def drawGhostShape(graphicsUtils, screen, colour, dir, gridSize):
+    (screen_x, screen_y) = screen
+    coords = []
+    for (x, y) in GHOST_SHAPE:
+        coords.append((x*gridSize*GHOST_SIZE + screen_x, y*gridSize*GHOST_SIZE + screen_y))
+
+    body = graphicsUtils.polygon(coords, colour, filled = 1)
+    WHITE = formatColor(1.0, 1.0, 1.0)
+    BLACK = formatColor(0.0, 0.0, 0.0)
+
+    dx = 0
+    dy = 0
+    if dir == 'North':
+        dy = -0.2
+    if dir == 'South':
+        dy = 0.2
+    if dir == 'East':
+        dx = 0.2
+    if dir == 'West':
+        dx = -0.2
+    leftEye = graphicsUtils.circle((screen_x+gridSize*GHOST_SIZE*(-0.3+dx/1.5), screen_y-gridSize*GHOST_SIZE*(0.3-dy/1.5)), gridSize*GHOST_SIZE*0.2, WHITE, WHITE)
+    rightEye = graphicsUtils.circle((screen_x+gridSize*GHOST_SIZE*(0.3+dx/1.5), screen_y-gridSize*GHOST_SIZE*(0.3-dy/1.5)), gridSize*GHOST_SIZE*0.2, WHITE, WHITE)
+    leftPupil = graphicsUtils.circle((screen_x+gridSize*GHOST_SIZE*(-0.3+dx), screen_y-gridSize*GHOST_SIZE*(0.3-dy)), gridSize*GHOST_SIZE*0.08, BLACK, BLACK)
+    rightPupil = graphicsUtils.circle((screen_x+gridSize*GHOST_SIZE*(0.3+dx), screen_y-gridSize*GHOST_SIZE*(0.3-dy)), gridSize*GHOST_SIZE*0.08, BLACK, BLACK)
+    ghostImageParts = []
+    ghostImageParts.append(body)
+    ghostImageParts.append(leftEye)
+    ghostImageParts.append(rightEye)
+    ghostImageParts.append(leftPupil)
+    ghostImageParts.append(rightPupil)
+
+    return ghostImageParts
+
+def drawFoodDot(graphicsUtils, screen, color, gridSize):
+    return graphicsUtils.circle( screen,
+                  FOOD_SIZE * gridSize,
+                  outlineColor = color, fillColor = color,
+                  width = 1)
+
+def drawCapsuleDot(graphicsUtils, screen, gridSize):
+    return graphicsUtils.circle( screen,
+                  CAPSULE_SIZE * gridSize,
+                  outlineColor = CAPSULE_COLOR,
+                  fillColor = CAPSULE_COLOR,
+                  width = 1)
+
 class InfoPane:
     def __init__(self, layout, gridSize):
         self.gridSize = gridSize
@@ -153,7 +245,33 @@ class InfoPane:
 
 
 class PacmanGraphics:
-    def __init__(self, zoom=1.0, frameTime=0.0, capture=False):
+    def __init__(self, zoom=1.0, frameTime=0.0, capture=False, renderer='tk',
+                 cacheBackground=False, cacheFood=False, windowRadius=None,
+                 spriteAtlas=False, deferred=False):
+        """
+        renderer selects the drawing backend: 'tk' draws on a Tk canvas and
+        grabs frames through PostScript, 'numpy' rasterises the same scene
+        straight into a uint8 array without Tk or Ghostscript.
+
+        With cacheBackground (numpy renderer only) the walls of a layout are
+        rasterised once into a background array kept in BACKGROUND_CACHE, and
+        frames only draw the moving sprites on top of it.  cacheFood also
+        bakes the initial food and capsules into that background; eaten
+        pellets are erased by restoring the walls-only layer underneath.
+
+        windowRadius (numpy renderer only) makes updateView rasterise just
+        the (2 * windowRadius + 1)-cell square centred on Pacman, at the
+        display's grid size, instead of the whole maze.
+
+        spriteAtlas (numpy renderer only) draws Pacman, ghosts, food and
+        capsules by blitting tiles from a SpriteAtlas instead of building
+        their arcs and polygons for every frame.
+
+        With deferred, update and updateView only note what changed (the
+        latest state of each agent that moved, the food and capsules eaten);
+        getImage draws all of it and renders the frame in one pass, so
+        frames nobody asks for are never drawn.
+        """
         self.have_window = 0
         self.currentGhostImages = {}
         self.pacmanImage = None
@@ -162,13 +280,39 @@ class PacmanGraphics:
         self.capture = capture
         self.frameTime = frameTime
         self.image = None
-        self.graphicsUtils = GraphicsUtils()
+        self.renderer = renderer
+        if renderer == 'tk':
+            self.graphicsUtils = GraphicsUtils()
+        elif renderer == 'numpy':
+            self.graphicsUtils = NumpyGraphicsUtils()
+        else:
+            raise Exception('Unknown renderer ' + str(renderer))
+        if cacheBackground and renderer != 'numpy':
+            raise Exception('cacheBackground requires the numpy renderer')
+        if windowRadius is not None and renderer != 'numpy':
+            raise Exception('windowRadius requires the numpy renderer')
+        self.windowRadius = windowRadius
+        if spriteAtlas and renderer != 'numpy':
+            raise Exception('spriteAtlas requires the numpy renderer')
+        self.atlas = getSpriteAtlas(self.gridSize, capture) if spriteAtlas else None
+        self.cacheBackground = cacheBackground
+        self.cacheFood = cacheBackground and cacheFood
+        self.wallLayer = None
+        self.deferred = deferred
+        self.clearPending()
 
     def checkNullDisplay(self):
         return self.image is None
 
+    def clearPending(self):
+        self.pendingAgents = {}
+        self.pendingFood = []
+        self.pendingCapsules = []
+        self.viewStale = False
+
     def initialize(self, state, isBlue = False):
         self.isBlue = isBlue
+        self.clearPending()
         self.startGraphics(state)
 
         # self.drawDistributions(state)
@@ -206,11 +350,58 @@ class PacmanGraphics:
 
     def drawStaticObjects(self, state):
         layout = self.layout
+        if self.cacheBackground:
+            self.drawCachedStaticObjects(layout)
+            return
         self.drawWalls(layout.walls)
         self.food = self.drawFood(layout.food)
         self.capsules = self.drawCapsules(layout.capsules)
         self.graphicsUtils.refresh()
 
+    def drawCachedStaticObjects(self, layout):
+        """
+        Installs the cached background for this layout, rasterising it first
+        on a cache miss.
+        """
+        key = (tuple(layout.layoutText), self.gridSize, self.capture, self.cacheFood)
+        if key in BACKGROUND_CACHE:
+            BACKGROUND_CACHE.move_to_end(key)
+        else:
+            BACKGROUND_CACHE[key] = self.rasterizeStaticObjects(layout)
+            if len(BACKGROUND_CACHE) > BACKGROUND_CACHE_SIZE:
+                BACKGROUND_CACHE.popitem(last=False)
+        walls, background, foodBoxes, capsuleBoxes = BACKGROUND_CACHE[key]
+
+        self.wallLayer = walls
+        if self.cacheFood:
+            # eating food edits the background, so each game gets its own copy
+            self.graphicsUtils.setBackground(background.copy())
+            self.food = foodBoxes
+            self.capsules = dict(capsuleBoxes)
+        else:
+            self.graphicsUtils.setBackground(background)
+            self.food = self.drawFood(layout.food)
+            self.capsules = self.drawCapsules(layout.capsules)
+
+    def rasterizeStaticObjects(self, layout):
+        """
+        Returns (walls, background, foodBoxes, capsuleBoxes): the walls-only
+        layer, the layer frames start from, and the pixel boxes of the food
+        and capsules baked into it (None unless cacheFood is set).
+        """
+        self.drawWalls(layout.walls)
+        walls = self.graphicsUtils.flatten()
+        if not self.cacheFood:
+            return walls, walls, None, None
+
+        food = self.drawFood(layout.food)
+        capsules = self.drawCapsules(layout.capsules)
+        foodBoxes = [[None if dot is None else self.graphicsUtils.itemBox(dot) for dot in column]
+                     for column in food]
+        capsuleBoxes = dict([(cell, self.graphicsUtils.itemBox(dot)) for cell, dot in capsules.items()])
+        background = self.graphicsUtils.flatten()
+        return walls, background, foodBoxes, capsuleBoxes
+
     def drawAgentObjects(self, state):
         self.agentImages = [] # (agentState, image)
         for index, agent in enumerate(state.agentStates):
@@ -239,15 +430,14 @@ class PacmanGraphics:
     def update(self, newState):
         agentIndex = newState._agentMoved
         agentState = newState.agentStates[agentIndex]
+        if self.deferred:
+            # successors never change an AgentState in place, so keeping it is safe
+            self.pendingAgents[agentIndex] = agentState
+            if newState._foodEaten != None: self.pendingFood.append(newState._foodEaten)
+            if newState._capsuleEaten != None: self.pendingCapsules.append(newState._capsuleEaten)
+            return
 
-        if self.agentImages[agentIndex][0].isPacman != agentState.isPacman: self.swapImages(agentIndex, agentState)
-        prevState, prevImage = self.agentImages[agentIndex]
-        if agentState.isPacman:
-            self.animatePacman(agentState, prevState, prevImage)
-        else:
-            self.moveGhost(agentState, agentIndex, prevState, prevImage)
-        self.agentImages[agentIndex] = (agentState, prevImage)
-
+        self.moveAgent(agentIndex, agentState)
         if newState._foodEaten != None:
             self.removeFood(newState._foodEaten, self.food)
         if newState._capsuleEaten != None:
@@ -256,10 +446,54 @@ class PacmanGraphics:
         if 'ghostDistances' in dir(newState):
             self.infoPane.updateGhostDistances(newState.ghostDistances)
 
+    def moveAgent(self, agentIndex, agentState):
+        if self.agentImages[agentIndex][0].isPacman != agentState.isPacman: self.swapImages(agentIndex, agentState)
+        prevState, prevImage = self.agentImages[agentIndex]
+        if agentState.isPacman:
+            self.animatePacman(agentState, prevState, prevImage)
+        else:
+            self.moveGhost(agentState, agentIndex, prevState, prevImage)
+        self.agentImages[agentIndex] = (agentState, prevImage)
+
     def updateView(self):
         # when all updates are done, update image repr
-        self.image = self.graphicsUtils.image()
-        
+        if self.deferred:
+            self.viewStale = True
+            return
+        self.renderView()
+
+    def getImage(self):
+        """
+        The current frame, after drawing any deferred updates.
+        """
+        if self.pendingAgents or self.pendingFood or self.pendingCapsules or self.viewStale:
+            for agentIndex, agentState in self.pendingAgents.items():
+                self.moveAgent(agentIndex, agentState)
+            for cell in self.pendingFood:
+                self.removeFood(cell, self.food)
+            for cell in self.pendingCapsules:
+                self.removeCapsule(cell, self.capsules)
+            self.clearPending()
+            self.renderView()
+        return self.image
+
+    def renderView(self):
+        if self.windowRadius is None:
+            self.image = self.graphicsUtils.image()
+        else:
+            self.image = self.graphicsUtils.image(self.windowViewport())
+
+    def windowViewport(self):
+        """
+        Returns the (left, top, width, height) canvas pixels of the cells
+        within windowRadius of Pacman.
+        """
+        x, y = nearestPoint(self.getPosition(self.agentImages[0][0]))
+        r = self.windowRadius
+        size = int(round((2 * r + 1) * self.gridSize))
+        left = int(round((x - r + 0.5) * self.gridSize))
+        top = int(round((self.height - y - r - 0.5) * self.gridSize))
+        return left, top, size, size
 
     def calculate_screen_dimensions(self, width, height):
         grid_width = (width-1) * self.gridSize
@@ -279,40 +513,30 @@ class PacmanGraphics:
     def drawPacman(self, pacman, index):
         position = self.getPosition(pacman)
         screen_point = self.to_screen(position)
+        if self.atlas is not None:
+            key = self.atlas.pacmanKey(self.getDirection(pacman), 0, index)
+            return [self.drawSprite(key, screen_point)]
         endpoints = self.getEndpoints(self.getDirection(pacman))
+        return drawPacmanShape(self.graphicsUtils, screen_point, endpoints, index, self.gridSize, self.capture)
 
-        width = PACMAN_OUTLINE_WIDTH
-        outlineColor = PACMAN_COLOR
-        fillColor = PACMAN_COLOR
-
-        if self.capture:
-            outlineColor = TEAM_COLORS[index % 2]
-            fillColor = GHOST_COLORS[index]
-            width = PACMAN_CAPTURE_OUTLINE_WIDTH
+    def drawSprite(self, key, screen_point):
+        pos, tile = self.atlas.place(key, screen_point)
+        return self.graphicsUtils.sprite(pos, tile)
 
-        return [self.graphicsUtils.circle(screen_point, PACMAN_SCALE * self.gridSize,
-                       fillColor = fillColor, outlineColor = outlineColor,
-                       endpoints = endpoints,
-                       width = width)]
+    def moveSprite(self, id, key, screen_point):
+        pos, tile = self.atlas.place(key, screen_point)
+        self.graphicsUtils.moveSprite(id, pos, tile)
 
     def getEndpoints(self, direction, position=(0,0)):
-        x, y = position
-        pos = x - int(x) + y - int(y)
-        width = 30 + 80 * math.sin(math.pi* pos)
-
-        delta = width / 2
-        if (direction == 'West'):
-            endpoints = (180+delta, 180-delta)
-        elif (direction == 'North'):
-            endpoints = (90+delta, 90-delta)
-        elif (direction == 'South'):
-            endpoints = (270+delta, 270-delta)
-        else:
-            endpoints = (0+delta, 0-delta)
-        return endpoints
+        return getEndpoints(direction, position)
 
     def movePacman(self, position, direction, image):
         screenPosition = self.to_screen(position)
+        if self.atlas is not None:
+            index = [parts for agent, parts in self.agentImages].index(image) if self.capture else 0
+            key = self.atlas.pacmanKey(direction, getMouthPhase(position), index)
+            self.moveSprite(image[0], key, screenPosition)
+            return
         endpoints = self.getEndpoints( direction, position )
         r = PACMAN_SCALE * self.gridSize
         self.graphicsUtils.moveCircle(image[0], screenPosition, r, endpoints)
@@ -333,38 +557,10 @@ class PacmanGraphics:
     def drawGhost(self, ghost, agentIndex):
         pos = self.getPosition(ghost)
         dir = self.getDirection(ghost)
-        (screen_x, screen_y) = (self.to_screen(pos) )
-        coords = []
-        for (x, y) in GHOST_SHAPE:
-            coords.append((x*self.gridSize*GHOST_SIZE + screen_x, y*self.gridSize*GHOST_SIZE + screen_y))
-
         colour = self.getGhostColor(ghost, agentIndex)
-        body = self.graphicsUtils.polygon(coords, colour, filled = 1)
-        WHITE = formatColor(1.0, 1.0, 1.0)
-        BLACK = formatColor(0.0, 0.0, 0.0)
-
-        dx = 0
-        dy = 0
-        if dir == 'North':
-            dy = -0.2
-        if dir == 'South':
-            dy = 0.2
-        if dir == 'East':
-            dx = 0.2
-        if dir == 'West':
-            dx = -0.2
-        leftEye = self.graphicsUtils.circle((screen_x+self.gridSize*GHOST_SIZE*(-0.3+dx/1.5), screen_y-self.gridSize*GHOST_SIZE*(0.3-dy/1.5)), self.gridSize*GHOST_SIZE*0.2, WHITE, WHITE)
-        rightEye = self.graphicsUtils.circle((screen_x+self.gridSize*GHOST_SIZE*(0.3+dx/1.5), screen_y-self.gridSize*GHOST_SIZE*(0.3-dy/1.5)), self.gridSize*GHOST_SIZE*0.2, WHITE, WHITE)
-        leftPupil = self.graphicsUtils.circle((screen_x+self.gridSize*GHOST_SIZE*(-0.3+dx), screen_y-self.gridSize*GHOST_SIZE*(0.3-dy)), self.gridSize*GHOST_SIZE*0.08, BLACK, BLACK)
-        rightPupil = self.graphicsUtils.circle((screen_x+self.gridSize*GHOST_SIZE*(0.3+dx), screen_y-self.gridSize*GHOST_SIZE*(0.3-dy)), self.gridSize*GHOST_SIZE*0.08, BLACK, BLACK)
-        ghostImageParts = []
-        ghostImageParts.append(body)
-        ghostImageParts.append(leftEye)
-        ghostImageParts.append(rightEye)
-        ghostImageParts.append(leftPupil)
-        ghostImageParts.append(rightPupil)
-
-        return ghostImageParts
+        if self.atlas is not None:
+            return [self.drawSprite(('ghost', colour, dir), self.to_screen(pos))]
+        return drawGhostShape(self.graphicsUtils, self.to_screen(pos), colour, dir, self.gridSize)
 
     def moveEyes(self, pos, dir, eyes):
         (screen_x, screen_y) = (self.to_screen(pos) )
@@ -384,6 +580,10 @@ class PacmanGraphics:
         self.graphicsUtils.moveCircle(eyes[3],(screen_x+self.gridSize*GHOST_SIZE*(0.3+dx), screen_y-self.gridSize*GHOST_SIZE*(0.3-dy)), self.gridSize*GHOST_SIZE*0.08)
 
     def moveGhost(self, ghost, ghostIndex, prevGhost, ghostImageParts):
+        if self.atlas is not None:
+            key = ('ghost', self.getGhostColor(ghost, ghostIndex), self.getDirection(ghost))
+            self.moveSprite(ghostImageParts[0], key, self.to_screen(self.getPosition(ghost)))
+            return
         old_x, old_y = self.to_screen(self.getPosition(prevGhost))
         new_x, new_y = self.to_screen(self.getPosition(ghost))
         delta = new_x - old_x, new_y - old_y
@@ -530,10 +730,10 @@ class PacmanGraphics:
             for yNum, cell in enumerate(x):
                 if cell: # There's food here
                     screen = self.to_screen((xNum, yNum ))
-                    dot = self.graphicsUtils.circle( screen,
-                                  FOOD_SIZE * self.gridSize,
-                                  outlineColor = color, fillColor = color,
-                                  width = 1)
+                    if self.atlas is not None:
+                        dot = self.drawSprite(('food', color), screen)
+                    else:
+                        dot = drawFoodDot(self.graphicsUtils, screen, color, self.gridSize)
                     imageRow.append(dot)
                 else:
                     imageRow.append(None)
@@ -543,21 +743,26 @@ class PacmanGraphics:
         capsuleImages = {}
         for capsule in capsules:
             ( screen_x, screen_y ) = self.to_screen(capsule)
-            dot = self.graphicsUtils.circle( (screen_x, screen_y),
-                              CAPSULE_SIZE * self.gridSize,
-                              outlineColor = CAPSULE_COLOR,
-                              fillColor = CAPSULE_COLOR,
-                              width = 1)
+            if self.atlas is not None:
+                dot = self.drawSprite(('capsule',), (screen_x, screen_y))
+            else:
+                dot = drawCapsuleDot(self.graphicsUtils, (screen_x, screen_y), self.gridSize)
             capsuleImages[capsule] = dot
         return capsuleImages
 
     def removeFood(self, cell, foodImages ):
         x, y = cell
-        self.graphicsUtils.remove_from_screen(foodImages[x][y])
+        if self.cacheFood:
+            self.graphicsUtils.restoreBackground(foodImages[x][y], self.wallLayer)
+        else:
+            self.graphicsUtils.remove_from_screen(foodImages[x][y])
 
     def removeCapsule(self, cell, capsuleImages ):
         x, y = cell
-        self.graphicsUtils.remove_from_screen(capsuleImages[(x, y)])
+        if self.cacheFood:
+            self.graphicsUtils.restoreBackground(capsuleImages.pop((x, y)), self.wallLayer)
+        else:
+            self.graphicsUtils.remove_from_screen(capsuleImages[(x, y)])
 
     def drawExpandedCells(self, cells):
         """
@@ -607,8 +812,11 @@ class PacmanGraphics:
         self.graphicsUtils.refresh()
 
 class FirstPersonPacmanGraphics(PacmanGraphics):
-    def __init__(self, zoom = 1.0, showGhosts = True, capture = False, frameTime=0):
-        PacmanGraphics.__init__(self, zoom, frameTime=frameTime)
+    def __init__(self, zoom = 1.0, showGhosts = True, capture = False, frameTime=0, renderer='tk',
+                 cacheBackground=False, cacheFood=False, spriteAtlas=False):
+        PacmanGraphics.__init__(self, zoom, frameTime=frameTime, renderer=renderer,
+                                cacheBackground=cacheBackground, cacheFood=cacheFood,
+                                spriteAtlas=spriteAtlas)
         self.showGhosts = showGhosts
         self.capture = capture
 
@@ -655,6 +863,101 @@ class FirstPersonPacmanGraphics(PacmanGraphics):
 def add(x, y):
     return (x[0] + y[0], x[1] + y[1])
 
+def getMouthPhase(position):
+    """
+    Quantises the mouth opening getEndpoints derives from a position to one
+    of MOUTH_PHASES steps.
+    """
+    x, y = position
+    pos = x - int(x) + y - int(y)
+    return int(round(pos * MOUTH_PHASES)) % MOUTH_PHASES
+
+def getSpriteAtlas(gridSize, capture=False):
+    key = (gridSize, capture)
+    if key not in SPRITE_ATLASES:
+        SPRITE_ATLASES[key] = SpriteAtlas(gridSize, capture)
+    return SPRITE_ATLASES[key]
+
+class SpriteAtlas:
+    """
+    Pre-rendered, alpha-masked tiles for everything that moves or gets
+    eaten: Pacman in each direction and mouth phase, ghosts in every colour
+    (and scared) looking each way, and the food and capsule dots.
+
+    Tiles are rasterised from the same shape functions PacmanGraphics draws
+    with, so blitting them reproduces the drawn items.  Only the grid size
+    and capture flag are kept, not the display that asked for the atlas.  Each tile is
+    2 * half pixels square with the shape centred on pixel (half, half)
+    plus a sub-pixel offset; tiles for other offsets are added on demand.
+    """
+    def __init__(self, gridSize, capture=False):
+        self.gridSize = gridSize
+        self.capture = capture
+        self.half = int(math.ceil(gridSize * 0.5)) + 4
+        self.tiles = {}
+
+        directions = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+        for direction in directions:
+            for phase in range(MOUTH_PHASES):
+                self.getTile(self.pacmanKey(direction, phase, 0), 0.0, 0.0)
+        for colour in GHOST_COLORS + [SCARED_COLOR]:
+            for direction in directions + [Directions.STOP]:
+                self.getTile(('ghost', colour, direction), 0.0, 0.0)
+        self.getTile(('food', FOOD_COLOR), 0.0, 0.0)
+        self.getTile(('capsule',), 0.0, 0.0)
+
+    def pacmanKey(self, direction, phase, index):
+        if direction not in (Directions.NORTH, Directions.SOUTH, Directions.WEST):
+            direction = Directions.EAST # getEndpoints draws everything else facing east
+        if not self.capture:
+            index = 0 # the colour only depends on the index in capture games
+        return ('pacman', direction, phase, index)
+
+    def place(self, key, screen_point):
+        """
+        Returns the top-left canvas pixel and the tile that draw key centred
+        on screen_point.
+        """
+        x, y = screen_point
+        ix, iy = int(math.floor(x)), int(math.floor(y))
+        fx = round((x - ix) * SUBPIXEL_STEPS) / float(SUBPIXEL_STEPS)
+        fy = round((y - iy) * SUBPIXEL_STEPS) / float(SUBPIXEL_STEPS)
+        return (ix - self.half, iy - self.half), self.getTile(key, fx, fy)
+
+    def getTile(self, key, fx, fy):
+        tile = self.tiles.get((key, fx, fy))
+        if tile is None:
+            tile = self.renderTile(key, (self.half + fx, self.half + fy))
+            self.tiles[(key, fx, fy)] = tile
+        return tile
+
+    def renderTile(self, key, center):
+        """
+        Draws the shape over two different backgrounds: pixels that come out
+        the same in both belong to the shape.
+        """
+        frames = []
+        for background in (formatColor(0, 0, 0), formatColor(1, 1, 1)):
+            canvas = NumpyGraphicsUtils()
+            canvas.begin_graphics(2 * self.half, 2 * self.half, background)
+            self.drawShape(canvas, key, center)
+            frames.append(canvas.image().copy())
+        mask = (frames[0] == frames[1]).all(axis=2)
+        return frames[0], mask
+
+    def drawShape(self, canvas, key, center):
+        if key[0] == 'pacman':
+            kind, direction, phase, index = key
+            endpoints = getEndpoints(direction, (phase / float(MOUTH_PHASES), 0))
+            drawPacmanShape(canvas, center, endpoints, index, self.gridSize, self.capture)
+        elif key[0] == 'ghost':
+            kind, colour, direction = key
+            drawGhostShape(canvas, center, colour, direction, self.gridSize)
+        elif key[0] == 'food':
+            drawFoodDot(canvas, center, key[1], self.gridSize)
+        else:
+            drawCapsuleDot(canvas, center, self.gridSize)
+
 
 # Saving graphical output
 # -----------------------
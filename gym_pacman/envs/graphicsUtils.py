@@ -18,14 +18,23 @@ import random
 import string
 import time
 import types
-import tkinter as Tkinter
 import io
 from time import sleep
 
-from PIL import Image, ImageDraw
+# Tk and PIL are only needed by the Tk canvas backend; the NumPy renderer
+# (numpyGraphicsUtils) runs without either of them
+try:
+    import tkinter as Tkinter
+except ImportError:
+    Tkinter = None
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:
+    Image = ImageDraw = None
 
 d_o_e = None # set this in begin graphics
-d_w = Tkinter._tkinter.DONT_WAIT
+d_w = Tkinter._tkinter.DONT_WAIT if Tkinter is not None else None
 
 def formatColor(r, g, b):
         return '#%02x%02x%02x' % (int(r * 255), int(g * 255), int(b * 255))
@@ -73,17 +82,23 @@ class GraphicsUtils:
             self._root_window.mainloop()
 
     def begin_graphics(self, width=640, height=480, color=formatColor(0, 0, 0), title=None):
-        # Check for duplicate call
-        if self._root_window is not None:
-            # Lose the window.
-            self._root_window.destroy()
-        
-
         # Save the canvas size parameters
         self._canvas_xs, self._canvas_ys = width - 1, height - 1
         self._canvas_x, self._canvas_y = 0, self._canvas_ys
         self._bg_color = color
 
+        # Check for duplicate call: keep the window and its Tk interpreter,
+        # just clear and resize the canvas
+        if self._root_window is not None and self._canvas is not None:
+            self._canvas.delete('all')
+            self._canvas.configure(width=width, height=height)
+            self.draw_background()
+            self._canvas.update()
+            return
+        if self._root_window is not None:
+            # Lose the half-built window.
+            self._root_window.destroy()
+
         # Create the root window
         self._root_window = Tkinter.Tk()
         self.d_o_e = self._root_window.dooneevent
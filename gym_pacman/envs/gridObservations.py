@@ -0,0 +1,75 @@
+# gridObservations.py
+# -------------------
+# Symbolic observations built straight from GameStateData, without rendering.
+
+import numpy as np
+
+from .util import nearestPoint
+
+# One plane per channel, in this order
+GRID_CHANNELS = ['walls', 'food', 'capsules', 'pacman', 'ghosts', 'scaredGhosts']
+WALLS, FOOD, CAPSULES, PACMAN, GHOSTS, SCARED_GHOSTS = range(len(GRID_CHANNELS))
+
+def getGridObservation(data, out=None):
+    """
+    Returns a (len(GRID_CHANNELS), height, width) uint8 array of 0/1 planes
+    for the given GameStateData.  Row 0 is the top of the maze, as in the
+    rendered frames, so cell (x, y) lands at [:, height - 1 - y, x].
+    Writes into out when given.
+    """
+    width, height = data.layout.width, data.layout.height
+    if out is None:
+        grid = np.zeros((len(GRID_CHANNELS), height, width), dtype=np.uint8)
+    else:
+        grid = out
+        grid[CAPSULES:] = 0
+    # Grids are indexed [x][y] with y pointing up
+    grid[WALLS] = data.layout.walls.data.T[::-1]
+    grid[FOOD] = data.food.data.T[::-1]
+    for x, y in data.capsules:
+        grid[CAPSULES, height - 1 - y, x] = 1
+
+    for index, agentState in enumerate(data.agentStates):
+        if agentState.configuration is None: continue
+        x, y = nearestPoint(agentState.getPosition())
+        grid[_agentChannel(index, agentState), height - 1 - y, x] = 1
+    return grid
+
+def _agentChannel(index, agentState):
+    if index == 0:
+        return PACMAN
+    elif agentState.scaredTimer > 0:
+        return SCARED_GHOSTS
+    return GHOSTS
+
+def getEgocentricGridObservation(data, radius, out=None):
+    """
+    The (2 * radius + 1)-cell square of getGridObservation centred on Pacman.
+    Cells outside the maze read as walls.  Writes into out when given.
+    """
+    size = 2 * radius + 1
+    if out is None:
+        out = np.empty((len(GRID_CHANNELS), size, size), dtype=np.uint8)
+    width, height = data.layout.width, data.layout.height
+    px, py = nearestPoint(data.agentStates[0].getPosition())
+    # cell (x, y) lands at [:, top - y, x - left]
+    left, top = px - radius, py + radius
+    out[...] = 0
+    out[WALLS] = 1
+
+    # the part of the window inside the maze
+    x0, x1 = max(left, 0), min(px + radius + 1, width)
+    y0, y1 = max(py - radius, 0), min(top + 1, height)
+    rows, columns = slice(top - (y1 - 1), top - y0 + 1), slice(x0 - left, x1 - left)
+    out[WALLS, rows, columns] = data.layout.walls.data[x0:x1, y0:y1].T[::-1]
+    out[FOOD, rows, columns] = data.food.data[x0:x1, y0:y1].T[::-1]
+    for x, y in data.capsules:
+        if abs(x - px) <= radius and abs(y - py) <= radius:
+            out[CAPSULES, top - y, x - left] = 1
+
+    for index, agentState in enumerate(data.agentStates):
+        if agentState.configuration is None: continue
+        x, y = nearestPoint(agentState.getPosition())
+        if abs(x - px) <= radius and abs(y - py) <= radius:
+            out[_agentChannel(index, agentState), top - y, x - left] = 1
+    return out
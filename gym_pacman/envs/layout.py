@@ -13,12 +13,18 @@
 
 
 from .util import manhattanDistance
-from .game import Grid
+from .game import Grid, ActionTable
+from .mazeDistances import MazeDistances
 import os
 import random
+import threading
 import numpy as np
 
 VISIBILITY_MATRIX_CACHE = {}
+ACTION_TABLE_CACHE = {}
+ACTION_TABLE_CACHE_SIZE = 1024
+MAZE_DISTANCE_CACHE = {}
+MAZE_DISTANCE_CACHE_SIZE = 64
 
 WALL, EMPTY, PACMAN, GHOST, FOOD = 0, 1, 2, 3, 4
 ITEM_REPR_STR = '% PG.'
@@ -38,7 +44,9 @@ class Layout:
         self.numGhosts = 0
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
-        self.totalFood = len(self.food.asList())
+        self.totalFood = self.food.count()
+        self.actionTable = None
+        self.mazeDistances = None
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
@@ -65,6 +73,35 @@ class Layout:
         else:
             self.visibility = VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)]
 
+    def getActionTable(self):
+        """
+        The ActionTable of this layout's walls, built on first use and shared
+        by every layout with the same text (deepCopy makes new Layouts).
+        """
+        if self.actionTable is None:
+            key = '\n'.join(self.layoutText)
+            if key not in ACTION_TABLE_CACHE:
+                if len(ACTION_TABLE_CACHE) >= ACTION_TABLE_CACHE_SIZE:
+                    del ACTION_TABLE_CACHE[next(iter(ACTION_TABLE_CACHE))] # oldest first
+                ACTION_TABLE_CACHE[key] = ActionTable(self.walls)
+            self.actionTable = ACTION_TABLE_CACHE[key]
+        return self.actionTable
+
+    def getMazeDistances(self, cacheDir=None):
+        """
+        The MazeDistances of this layout, computed on first use (or loaded
+        from cacheDir, where it is also saved) and shared like the action
+        table.
+        """
+        if self.mazeDistances is None:
+            key = '\n'.join(self.layoutText)
+            if key not in MAZE_DISTANCE_CACHE:
+                if len(MAZE_DISTANCE_CACHE) >= MAZE_DISTANCE_CACHE_SIZE:
+                    del MAZE_DISTANCE_CACHE[next(iter(MAZE_DISTANCE_CACHE))] # oldest first
+                MAZE_DISTANCE_CACHE[key] = MazeDistances(self, cacheDir)
+            self.mazeDistances = MAZE_DISTANCE_CACHE[key]
+        return self.mazeDistances
+
     def isWall(self, pos):
         x, col = pos
         return self.walls[x][col]
@@ -192,14 +229,95 @@ def generateMaze(maze_size, decimation, start_pos,np_random):
                 maze[y][x] = 1.
     return maze
 
+# Steps the maze generator carves in, in generateMaze's order
+MAZE_STEPS = np.array([(-1, 0), (0, 1), (0, -1), (1, 0)])
+
+def generateMazes(n, maze_size, decimation, np_random, start_positions=None):
+    """
+    n mazes drawn like generateMaze, as an (n, maze_size, maze_size) uint8
+    array of EMPTY / WALL.  Every maze runs its own depth-first carve, all
+    in lockstep: each round pops one stack entry per unfinished maze.
+    start_positions is (n, 2) of (row, column), uniform in the interior by
+    default.  Only np_random.uniform is used, so RandomStates and
+    Generators both work.
+    """
+    if start_positions is None:
+        start_positions = 1 + (np_random.uniform(size=(n, 2)) * (maze_size - 2)).astype(int)
+    mazes = np.zeros((n, maze_size, maze_size), dtype=np.uint8)
+    games = np.arange(n)
+    # per maze, a stack of (row, column, step row, step column).  The carve
+    # only visits cells two steps apart, at most ((maze_size - 1) // 2)**2 of
+    # them; each visit pops one entry and pushes at most three (four from the
+    # start), so the stack never holds more than 2 * cells + 2 entries
+    cells = ((maze_size - 1) // 2) ** 2
+    stacks = np.zeros((n, 2 * cells + 2, 4), dtype=np.int32)
+    stacks[:, 0, :2] = start_positions
+    depth = np.ones(n, dtype=np.int64)
+
+    while depth.any():
+        active = games[depth > 0]
+        depth[active] -= 1
+        entry = stacks[active, depth[active]]
+        # Has this not been filled since being added?
+        fresh = mazes[active, entry[:, 0], entry[:, 1]] == 0
+        active, pos, prev = active[fresh], entry[fresh, :2], entry[fresh, 2:]
+
+        # Fill in this point + break down wall from previous position
+        mazes[active, pos[:, 0], pos[:, 1]] = 1
+        mazes[active, pos[:, 0] - prev[:, 0], pos[:, 1] - prev[:, 1]] = 1
+
+        perm = np_random.uniform(size=(len(active), 4)).argsort(axis=1)
+        for i in range(4):
+            step = MAZE_STEPS[perm[:, i]]
+            next = pos + 2 * step
+            push = ((next > 0) & (next < maze_size - 1)).all(axis=1)
+            push[push] = mazes[active[push], next[push, 0], next[push, 1]] == 0
+            pushed = active[push]
+            stacks[pushed, depth[pushed], :2] = next[push]
+            stacks[pushed, depth[pushed], 2:] = step[push]
+            depth[pushed] += 1
+
+    mazes[:, 1:-1, 1:-1] |= np_random.uniform(size=(n, maze_size - 2, maze_size - 2)) < decimation
+    return mazes
+
 def getRandomLayout(layout_params, np_random):
+    return layoutFromCodes(getRandomLayoutCodes(layout_params, np_random))
+
+def getRandomLayoutCodes(layout_params, np_random):
     nok = True
     while nok:
         # print('Sampling new layout')
-        layout, nok = randomLayout(layout_params, np_random)
-    return layout
+        maze, nok = randomLayoutCodes(layout_params, np_random)
+    return maze
+
+def randint(np_random, low, high):
+    # gym's seeding hands out Generators, which have no randint
+    if hasattr(np_random, 'integers'):
+        return np_random.integers(low, high)
+    return np_random.randint(low, high)
 
 def randomLayout(layout_params, np_random):
+    maze, nok = randomLayoutCodes(layout_params, np_random)
+    if nok:
+        return None, True
+    return layoutFromCodes(maze), nok
+
+def layoutFromCodes(maze):
+    """
+    Builds a Layout from a 2-d array of WALL, EMPTY, PACMAN, GHOST and FOOD
+    codes, first row at the top.
+    """
+    maze_str = []
+    for i in range(maze.shape[0]):
+        line = ''.join([ITEM_REPR_STR[m] for m in maze[i]])
+        maze_str.append(line)
+    return Layout(maze_str)
+
+def randomLayoutCodes(layout_params, np_random):
+    """
+    One attempt at a random maze, as a uint8 array of codes (see
+    layoutFromCodes); nok is True when the attempt failed.
+    """
     nok = False
     size = layout_params.get('size', 7)
     nghosts = layout_params.get('nghosts', 1)
@@ -207,10 +325,10 @@ def randomLayout(layout_params, np_random):
     food_proportion = layout_params.get('food_proportion', 1.0)
     by_proportion = layout_params.get('by_proportion', True)
 
-    start_x, start_y = np_random.randint(1, size - 1), np_random.randint(1, size - 1)
+    start_x, start_y = randint(np_random, 1, size - 1), randint(np_random, 1, size - 1)
 
 
-    maze = generateMaze(size, 0.3, (start_y, start_x), np_random).astype(np.int)
+    maze = generateMaze(size, 0.3, (start_y, start_x), np_random).astype(np.uint8)
     # maze = np.zeros((size, size), dtype=np.int)
     # maze[1:size-1,1:size-1] = maze_
     maze[start_y, start_x] = PACMAN
@@ -219,11 +337,11 @@ def randomLayout(layout_params, np_random):
     foods = []
     if by_proportion:
         for ix in range(empty_positions[0].shape[0]):
-            if np.random.rand() <= food_proportion:
+            if np_random.uniform() <= food_proportion:
                 maze[empty_positions[0][ix], empty_positions[1][ix]] = FOOD
                 foods.append((empty_positions[0][ix], empty_positions[1][ix]))
     else:
-        food_positions = np.random.choice(np.arange(empty_positions[0].shape[0]), npellets)
+        food_positions = np_random.choice(np.arange(empty_positions[0].shape[0]), npellets)
         for pos in food_positions:
             maze[empty_positions[0][pos], empty_positions[1][pos]] = FOOD
             foods.append((empty_positions[0][pos], empty_positions[1][pos]))
@@ -246,12 +364,175 @@ def randomLayout(layout_params, np_random):
     else:
         # print('Could not find enough positions for ghosts')
         return None, True
+    return maze, nok
 
-    maze_str = []
-    for i in range(maze.shape[0]):
-        line = ''.join([ITEM_REPR_STR[m] for m in maze[i]])
-        maze_str.append(line)
-    return Layout(maze_str), nok
+def choosePositions(mask, k, np_random):
+    """
+    For each row of a 2-d bool mask, k indices of True entries drawn
+    uniformly with replacement (like np_random.choice); found is False for
+    rows without any.
+    """
+    counts = mask.sum(axis=1)
+    draws = (np_random.uniform(size=(len(mask), k)) * counts[:, None]).astype(int)
+    cumulative = mask.cumsum(axis=1)
+    return (cumulative[:, None, :] > draws[:, :, None]).argmax(axis=2), counts > 0
+
+def floodFill(passable, starts):
+    """
+    The cells of each (rows, columns) grid of passable connected to its
+    start cell.
+    """
+    games = np.arange(len(passable))
+    reached = np.zeros(passable.shape, dtype=bool)
+    reached[games, starts[:, 0], starts[:, 1]] = True
+    while True:
+        grown = reached.copy()
+        grown[:, 1:] |= reached[:, :-1]
+        grown[:, :-1] |= reached[:, 1:]
+        grown[:, :, 1:] |= reached[:, :, :-1]
+        grown[:, :, :-1] |= reached[:, :, 1:]
+        grown &= passable
+        grown[games, starts[:, 0], starts[:, 1]] = True
+        if (grown == reached).all():
+            return reached
+        reached = grown
+
+def randomLayoutCodesBatch(layout_params, n, np_random):
+    """
+    n attempts of randomLayoutCodes at once: returns the (n, size, size)
+    code arrays and a mask of the attempts that worked.  Reachability is
+    checked by flooding Pacman's component instead of a DFS per maze.
+    """
+    size = layout_params.get('size', 7)
+    nghosts = layout_params.get('nghosts', 1)
+    npellets = layout_params.get('npellets', 1)
+    food_proportion = layout_params.get('food_proportion', 1.0)
+    by_proportion = layout_params.get('by_proportion', True)
+    games = np.arange(n)
+
+    starts = 1 + (np_random.uniform(size=(n, 2)) * (size - 2)).astype(int) # (row, column)
+    mazes = generateMazes(n, size, 0.3, np_random, starts)
+    mazes[games, starts[:, 0], starts[:, 1]] = PACMAN
+    flat = mazes.reshape(n, -1)
+    ok = np.ones(n, dtype=bool)
+
+    empty = flat == EMPTY
+    if by_proportion:
+        food = empty & (np_random.uniform(size=empty.shape) <= food_proportion)
+    else:
+        cells, found = choosePositions(empty, npellets, np_random)
+        ok &= found
+        food = np.zeros(empty.shape, dtype=bool)
+        food[games[:, None], cells] = True
+        food &= empty
+    flat[food] = FOOD
+
+    reached = floodFill(mazes != WALL, starts).reshape(n, -1)
+    ok &= ~(food & ~reached).any(axis=1)
+
+    # ghosts go on empty cells more than 2 steps from pacman
+    rows, columns = np.indices((size, size))
+    distance = np.abs(rows - starts[:, 0, None, None]) + np.abs(columns - starts[:, 1, None, None])
+    candidates = (flat == EMPTY) & (distance.reshape(n, -1) > 2)
+    if nghosts > 0:
+        ok &= candidates.sum(axis=1) >= nghosts
+        cells, found = choosePositions(candidates, nghosts, np_random)
+        placed = games[ok]
+        flat[placed[:, None], cells[ok]] = GHOST
+    else:
+        ok[:] = False # as in randomLayoutCodes
+    return mazes, ok
+
+def getRandomLayoutCodesBatch(layout_params, n, np_random):
+    """
+    n valid random mazes as an (n, size, size) code array; the batched
+    counterpart of getRandomLayoutCodes.
+    """
+    batches = []
+    total = 0
+    while total < n:
+        mazes, ok = randomLayoutCodesBatch(layout_params, max(n - total, 16), np_random)
+        batches.append(mazes[ok])
+        total += ok.sum()
+    return np.concatenate(batches)[:n]
+
+BANK_CHUNK = 64 # layouts a LayoutBank generates at a time
+
+class LayoutBank:
+    """
+    A queue of ready-made random layouts for one layout_params dict, so
+    resets don't wait on the rejection sampling in getRandomLayout.
+
+    Layouts are kept as uint8 code arrays (see layoutFromCodes) in a ring of
+    size slots.  With background=True a daemon thread tops the ring up
+    whenever a layout is drawn; otherwise it is filled up front and refilled
+    on the calling thread when it runs dry.  Layouts are generated
+    BANK_CHUNK at a time by getRandomLayoutCodesBatch and come out in that
+    order from a single RandomState(seed), so a seeded bank always yields
+    the same stream.
+    """
+    def __init__(self, layout_params, size=64, seed=None, background=True):
+        self.layout_params = layout_params
+        self.np_random = np.random.RandomState(seed)
+        mazeSize = layout_params.get('size', 7)
+        self.codes = np.zeros((size, mazeSize, mazeSize), dtype=np.uint8)
+        self.head = 0
+        self.count = 0
+        self.closed = False
+        self.pending = [] # generated, not yet in the ring
+        self.condition = threading.Condition()
+        self.thread = None
+        if background:
+            self.thread = threading.Thread(target=self._refill, daemon=True)
+            self.thread.start()
+        else:
+            while self.count < size:
+                self._push(self._generate())
+
+    def _generate(self):
+        if not self.pending:
+            self.pending = list(getRandomLayoutCodesBatch(self.layout_params, BANK_CHUNK, self.np_random))[::-1]
+        return self.pending.pop()
+
+    def _push(self, maze):
+        self.codes[(self.head + self.count) % len(self.codes)] = maze
+        self.count += 1
+
+    def _refill(self):
+        while True:
+            with self.condition:
+                while self.count == len(self.codes) and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+            # only this thread adds layouts, so the free slot stays free
+            maze = self._generate()
+            with self.condition:
+                self._push(maze)
+                self.condition.notify_all()
+
+    def drawCodes(self):
+        """
+        Takes the next layout off the bank as a code array.
+        """
+        with self.condition:
+            if self.thread is None and self.count == 0:
+                self._push(self._generate())
+            while self.count == 0:
+                self.condition.wait()
+            maze = self.codes[self.head].copy()
+            self.head = (self.head + 1) % len(self.codes)
+            self.count -= 1
+            self.condition.notify_all()
+        return maze
+
+    def draw(self):
+        return layoutFromCodes(self.drawCodes())
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
 
 def dfsReachabilityCheck(maze, start_x, start_y, food_positions):
     stack = [(start_y, start_x)]
@@ -0,0 +1,224 @@
+# layoutDataset.py
+# ----------------
+# A binary file of pre-generated layouts that is read through np.memmap, so
+# opening even millions of layouts costs no parsing.
+#
+# File format (little endian):
+#   header, HEADER_SIZE bytes: HEADER_DTYPE, zero padded
+#   count records of recordDtype(width, height, maxGhosts), back to back
+# Grids are packed with np.packbits in Grid.data order (x-major, y up).
+
+import json
+import sys
+
+import numpy as np
+
+from .layout import Layout, getRandomLayoutCodesBatch, WALL, FOOD, PACMAN, GHOST
+
+MAGIC = b'PACLAYS1'
+VERSION = 1
+HEADER_SIZE = 64
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('version', '<u4'), ('count', '<u8'),
+                         ('width', '<u4'), ('height', '<u4'), ('maxGhosts', '<u4')])
+WRITE_CHUNK = 10000 # records buffered before a write
+
+def recordDtype(width, height, maxGhosts):
+    gridBytes = (width * height + 7) // 8
+    return np.dtype([('walls', 'u1', (gridBytes,)),
+                     ('food', 'u1', (gridBytes,)),
+                     ('capsules', 'u1', (gridBytes,)),
+                     ('pacman', 'u1', (2,)),
+                     ('numGhosts', 'u1'),
+                     ('ghosts', 'u1', (maxGhosts, 2))])
+
+class LayoutDatasetWriter:
+    """
+    Appends layouts (or randomLayout code arrays) to a new dataset file; the
+    record count in the header is filled in by close.
+    """
+    def __init__(self, path, width, height, maxGhosts):
+        self.width, self.height, self.maxGhosts = width, height, maxGhosts
+        self.dtype = recordDtype(width, height, maxGhosts)
+        self.file = open(path, 'wb')
+        self.count = 0
+        self.buffer = np.zeros(WRITE_CHUNK, dtype=self.dtype)
+        self.buffered = 0
+        self._writeHeader()
+
+    def _writeHeader(self):
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header[0] = (MAGIC, VERSION, self.count, self.width, self.height, self.maxGhosts)
+        self.file.seek(0)
+        self.file.write(header.tobytes().ljust(HEADER_SIZE, b'\0'))
+
+    def addGrids(self, walls, food, capsules, pacman, ghosts):
+        """
+        Adds one layout given as (width, height) bool arrays indexed [x, y]
+        and agent start cells.
+        """
+        if len(ghosts) > self.maxGhosts:
+            raise Exception('Layout has %d ghosts, the dataset holds at most %d' % (len(ghosts), self.maxGhosts))
+        record = self.buffer[self.buffered]
+        record['walls'] = np.packbits(walls)
+        record['food'] = np.packbits(food)
+        record['capsules'] = np.packbits(capsules)
+        record['pacman'] = pacman
+        record['numGhosts'] = len(ghosts)
+        record['ghosts'] = 0
+        if len(ghosts):
+            record['ghosts'][:len(ghosts)] = ghosts
+        self.buffered += 1
+        self.count += 1
+        if self.buffered == WRITE_CHUNK:
+            self.flush()
+
+    def addLayout(self, layout):
+        capsules = np.zeros((layout.width, layout.height), dtype=bool)
+        for x, y in layout.capsules:
+            capsules[x, y] = True
+        positions = [pos for isPacman, pos in layout.agentPositions]
+        self.addGrids(layout.walls.data, layout.food.data, capsules, positions[0], positions[1:])
+
+    def addCodes(self, maze):
+        """
+        Adds a randomLayoutCodes maze (first row at the top) without building
+        a Layout.
+        """
+        grid = maze[::-1].T # to [x, y]
+        # argwhere lists cells in x, y order, like Layout.agentPositions
+        self.addGrids(grid == WALL, grid == FOOD, np.zeros(grid.shape, dtype=bool),
+                      np.argwhere(grid == PACMAN)[0], np.argwhere(grid == GHOST))
+
+    def addCodesBatch(self, mazes):
+        """
+        addCodes for an (n, height, width) array of mazes at once.
+        """
+        n = len(mazes)
+        grids = mazes[:, ::-1].transpose(0, 2, 1).reshape(n, -1) # x-major, like Grid.data
+        ghosts = grids == GHOST
+        numGhosts = ghosts.sum(axis=1)
+        if (numGhosts > self.maxGhosts).any():
+            raise Exception('Layout has %d ghosts, the dataset holds at most %d' % (numGhosts.max(), self.maxGhosts))
+        records = np.zeros(n, dtype=self.dtype)
+        records['walls'] = np.packbits(grids == WALL, axis=1)
+        records['food'] = np.packbits(grids == FOOD, axis=1)
+        records['capsules'] = np.packbits(np.zeros(grids.shape, dtype=bool), axis=1)
+        pacman = (grids == PACMAN).argmax(axis=1)
+        records['pacman'] = np.stack([pacman // self.height, pacman % self.height], axis=1)
+        records['numGhosts'] = numGhosts
+        # ghost cells in index order, padded with whatever comes after
+        cells = np.argsort(~ghosts, axis=1, kind='stable')[:, :self.maxGhosts]
+        slots = np.arange(self.maxGhosts)[None] < numGhosts[:, None]
+        records['ghosts'] = np.where(slots[..., None], np.stack([cells // self.height, cells % self.height], axis=2), 0)
+        self.flush()
+        self.file.write(records.tobytes())
+        self.count += n
+
+    def flush(self):
+        self.file.write(self.buffer[:self.buffered].tobytes())
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+        self._writeHeader()
+        self.file.close()
+
+class LayoutDataset:
+    """
+    A layout dataset file mapped into memory.  dataset[i] builds the i-th
+    Layout on demand; getArrays and getBatchGameState hand whole batches to
+    the array-based code without building any Layout.
+    """
+    def __init__(self, path):
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)[0]
+        if header['magic'] != MAGIC:
+            raise Exception('%s is not a layout dataset' % path)
+        if header['version'] != VERSION:
+            raise Exception('Unsupported layout dataset version %d' % header['version'])
+        self.width, self.height = int(header['width']), int(header['height'])
+        self.maxGhosts = int(header['maxGhosts'])
+        self.count = int(header['count'])
+        self.records = np.memmap(path, dtype=recordDtype(self.width, self.height, self.maxGhosts),
+                                 mode='r', offset=HEADER_SIZE, shape=(self.count,))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return self.getLayout(i)
+
+    def _unpack(self, packed):
+        cells = self.width * self.height
+        return np.unpackbits(packed, axis=-1, count=cells).reshape(packed.shape[:-1] + (self.width, self.height)).astype(bool)
+
+    def getLayout(self, i):
+        record = self.records[i]
+        text = np.full((self.width, self.height), ' ')
+        text[self._unpack(record['walls'])] = '%'
+        text[self._unpack(record['food'])] = '.'
+        text[self._unpack(record['capsules'])] = 'o'
+        for x, y in record['ghosts'][:record['numGhosts']]:
+            text[x, y] = 'G'
+        x, y = record['pacman']
+        text[x, y] = 'P'
+        # Layout text has the top row first
+        return Layout([''.join(row) for row in text.T[::-1]])
+
+    def getArrays(self, indices):
+        """
+        The layouts at indices as the arrays BatchGameState takes: walls,
+        food and capsules (B, width, height), agentPositions (B, A, 2) with
+        Pacman first and agentMask (B, A).
+        """
+        records = self.records[np.asarray(indices)]
+        B = len(records)
+        agentPositions = np.zeros((B, 1 + self.maxGhosts, 2), dtype=np.int32)
+        agentPositions[:, 0] = records['pacman']
+        agentPositions[:, 1:] = records['ghosts']
+        agentMask = np.arange(1 + self.maxGhosts)[None] <= records['numGhosts'][:, None]
+        return {'walls': self._unpack(records['walls']),
+                'food': self._unpack(records['food']),
+                'capsules': self._unpack(records['capsules']),
+                'agentPositions': agentPositions,
+                'agentMask': agentMask}
+
+    def getBatchGameState(self, indices):
+        from .batchPacman import BatchGameState
+        return BatchGameState(**self.getArrays(indices))
+
+def writeRandomLayouts(path, layout_params, count, seed=None):
+    """
+    Writes count random layouts, generated WRITE_CHUNK at a time by
+    getRandomLayoutCodesBatch from RandomState(seed).
+    """
+    np_random = np.random.RandomState(seed)
+    size = layout_params.get('size', 7)
+    writer = LayoutDatasetWriter(path, size, size, layout_params.get('nghosts', 1))
+    for start in range(0, count, WRITE_CHUNK):
+        writer.addCodesBatch(getRandomLayoutCodesBatch(layout_params, min(WRITE_CHUNK, count - start), np_random))
+    writer.close()
+
+def readCommand( argv ):
+    from optparse import OptionParser
+    usageStr = """
+    USAGE:      python -m gym_pacman.envs.layoutDataset <options>
+    EXAMPLE:    python -m gym_pacman.envs.layoutDataset -n 1000000 -s 0 -o mazes.bin
+                    - writes a million random layouts for layout_params.json
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-n', '--numLayouts', dest='numLayouts', type='int',
+                      help='the number of layouts to write', default=1000)
+    parser.add_option('-o', '--output', dest='output',
+                      help='the dataset FILE to write', metavar='FILE', default='layouts.bin')
+    parser.add_option('-p', '--params', dest='params',
+                      help='the layout_params JSON FILE', metavar='FILE', default='layout_params.json')
+    parser.add_option('-s', '--seed', dest='seed', type='int',
+                      help='seed for the layout generator', default=None)
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+if __name__ == '__main__':
+    options = readCommand( sys.argv[1:] )
+    writeRandomLayouts(options.output, json.load(open(options.params)), options.numLayouts, options.seed)
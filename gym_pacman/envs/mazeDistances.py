@@ -0,0 +1,114 @@
+# mazeDistances.py
+# ----------------
+# All-pairs maze distances of a layout, computed with NumPy and optionally
+# cached on disk.
+
+import hashlib
+import math
+import os
+
+import numpy as np
+
+UNREACHABLE = np.iinfo(np.uint16).max
+
+class MazeDistances:
+    """
+    Shortest-path distances between every pair of non-wall cells of a
+    layout, from a breadth-first search out of every cell, kept as a
+    uint16 matrix.  Use Layout.getMazeDistances to share one per layout.
+
+    Positions between grid points (ghosts moving at half speed) are measured
+    through the grid points next to them.
+    """
+    def __init__(self, layout, cacheDir=None):
+        walls = layout.walls
+        self.width, self.height = walls.width, walls.height
+        self.cells = [tuple(cell) for cell in np.argwhere(~walls.data).tolist()]
+        # index[x, y] is the row of cell (x, y); walls point at the padding
+        # column distancesFrom appends
+        self.index = np.full((self.width, self.height), len(self.cells), dtype=np.int64)
+        for i, (x, y) in enumerate(self.cells):
+            self.index[x, y] = i
+
+        path = None
+        if cacheDir is not None:
+            digest = hashlib.sha1('\n'.join(layout.layoutText).encode('utf-8')).hexdigest()
+            path = os.path.join(cacheDir, 'mazeDistances-%s.npy' % digest)
+        if path is not None and os.path.exists(path):
+            self.matrix = np.load(path)
+        else:
+            self.matrix = self._search(layout.getActionTable())
+            if path is not None:
+                if not os.path.isdir(cacheDir): os.makedirs(cacheDir)
+                np.save(path, self.matrix)
+
+    def _search(self, table):
+        """
+        Breadth-first search from all cells at once: row s of the frontier
+        holds the cells first reached from s at the current distance.
+        """
+        numCells = len(self.cells)
+        neighbors = np.full((numCells, 5), numCells, dtype=np.int64)
+        for i, (x, y) in enumerate(self.cells):
+            for k, (nx, ny) in enumerate(table.neighbors[x][y]):
+                neighbors[i, k] = self.index[nx, ny]
+
+        matrix = np.full((numCells, numCells), UNREACHABLE, dtype=np.uint16)
+        frontier = np.eye(numCells, dtype=bool)
+        reached = frontier.copy()
+        distance = 0
+        while frontier.any():
+            matrix[frontier] = distance
+            distance += 1
+            # a cell is next if one of its neighbours is on the frontier
+            padded = np.concatenate([frontier, np.zeros((numCells, 1), dtype=bool)], axis=1)
+            frontier = padded[:, neighbors].any(axis=2) & ~reached
+            reached |= frontier
+        return matrix
+
+    def _gridPoints(self, position):
+        """
+        The non-wall grid points around position, with the distance to each.
+        """
+        x, y = position
+        points = []
+        for gx in set([int(math.floor(x)), int(math.ceil(x))]):
+            for gy in set([int(math.floor(y)), int(math.ceil(y))]):
+                if 0 <= gx < self.width and 0 <= gy < self.height and self.index[gx, gy] < len(self.cells):
+                    points.append((self.index[gx, gy], abs(x - gx) + abs(y - gy)))
+        return points
+
+    def distance(self, a, b):
+        """
+        Maze distance between positions a and b; UNREACHABLE if there is no
+        path (or either is inside a wall).
+        """
+        if a[0] == int(a[0]) and a[1] == int(a[1]) and b[0] == int(b[0]) and b[1] == int(b[1]):
+            i, j = self.index[int(a[0]), int(a[1])], self.index[int(b[0]), int(b[1])]
+            if i < len(self.cells) and j < len(self.cells):
+                return int(self.matrix[i, j])
+            return UNREACHABLE
+        best = UNREACHABLE
+        for i, da in self._gridPoints(a):
+            for j, db in self._gridPoints(b):
+                if self.matrix[i, j] != UNREACHABLE:
+                    best = min(best, da + int(self.matrix[i, j]) + db)
+        return best
+
+    def distancesFrom(self, a):
+        """
+        A (width, height) array, indexed [x, y] like a Grid, of the maze
+        distance from a to every cell; walls and unreachable cells hold
+        UNREACHABLE.  The array is uint16 when a is a grid point and float
+        otherwise.
+        """
+        best = None
+        for i, da in self._gridPoints(a):
+            row = np.append(self.matrix[i], UNREACHABLE)[self.index]
+            if da == 0:
+                return row
+            row = np.where(row == UNREACHABLE, UNREACHABLE, row + da)
+            best = row if best is None else np.minimum(best, row)
+        if best is None:
+            return np.full((self.width, self.height), UNREACHABLE, dtype=np.uint16)
+        return best
@@ -0,0 +1,540 @@
+# numpyGraphicsUtils.py
+# ---------------------
+# Headless replacement for GraphicsUtils.  Canvas items are kept in memory
+# with the same coordinate conventions as the Tk canvas and are rasterised
+# straight into a preallocated uint8 HxWx3 frame, so no X display, Tk or
+# Ghostscript is needed to produce observations.
+
+import math
+import time
+
+import numpy as np
+
+SMOOTH_STEPS = 8 # Segments per spline piece of a smoothed polygon
+
+_COLOR_CACHE = {}
+
+def parseColor(color):
+    """
+    Converts a '#rrggbb' string (see formatColor) to an RGB uint8 triple.
+    Empty colours (unfilled shapes) are returned as None.
+    """
+    if not color:
+        return None
+    rgb = _COLOR_CACHE.get(color)
+    if rgb is None:
+        rgb = np.array([int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16)], dtype=np.uint8)
+        _COLOR_CACHE[color] = rgb
+    return rgb
+
+def smoothPolygon(points, steps=SMOOTH_STEPS):
+    """
+    Approximates Tk's smoothed polygons: every vertex is the control point of
+    a quadratic spline running between the midpoints of its two edges.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    prev = np.roll(points, 1, axis=0)
+    next = np.roll(points, -1, axis=0)
+    start = (prev + points) / 2.0
+    end = (points + next) / 2.0
+    t = np.linspace(0.0, 1.0, steps, endpoint=False)[None, :, None]
+    curve = (1 - t) ** 2 * start[:, None] + 2 * (1 - t) * t * points[:, None] + t ** 2 * end[:, None]
+    return curve.reshape(-1, 2)
+
+def _segmentMask(px, py, ax, ay, bx, by, half, butt):
+    """
+    Pixels within half a line width of the segment (ax, ay)-(bx, by).  Butt
+    caps stop the stroke at the end points, otherwise the ends are rounded.
+    """
+    vx, vy = bx - ax, by - ay
+    length2 = vx * vx + vy * vy
+    if length2 == 0:
+        return (px - ax) ** 2 + (py - ay) ** 2 <= half * half
+    t = ((px - ax) * vx + (py - ay) * vy) / length2
+    if butt:
+        dist = np.abs((px - ax) * vy - (py - ay) * vx) / math.sqrt(length2)
+        return (t >= 0) & (t <= 1) & (dist <= half)
+    t = np.clip(t, 0.0, 1.0)
+    dx = px - (ax + t * vx)
+    dy = py - (ay + t * vy)
+    return dx * dx + dy * dy <= half * half
+
+def _angleMask(dx, dy, start, extent):
+    if extent >= 360:
+        return np.ones(np.broadcast(dx, dy).shape, dtype=bool)
+    theta = np.degrees(np.arctan2(-dy, dx))
+    return (theta - start) % 360.0 <= extent
+
+def _outlineMask(points, px, py, half):
+    """
+    Pixels within half a line width of any edge of a closed polygon.
+    """
+    ax, ay = points[:, 0, None, None], points[:, 1, None, None]
+    nxt = np.roll(points, -1, axis=0)
+    vx, vy = nxt[:, 0, None, None] - ax, nxt[:, 1, None, None] - ay
+    length2 = np.maximum(vx * vx + vy * vy, 1e-12)
+    t = np.clip(((px - ax) * vx + (py - ay) * vy) / length2, 0.0, 1.0)
+    dx = px - (ax + t * vx)
+    dy = py - (ay + t * vy)
+    return (dx * dx + dy * dy).min(axis=0) <= half * half
+
+def _polygonMask(points, px, py):
+    """
+    Even-odd fill of a closed polygon, vectorised over all of its edges.
+    """
+    ax, ay = points[:, 0, None, None], points[:, 1, None, None]
+    nxt = np.roll(points, -1, axis=0)
+    bx, by = nxt[:, 0, None, None], nxt[:, 1, None, None]
+    straddles = (ay > py) != (by > py)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossX = (bx - ax) * (py - ay) / (by - ay) + ax
+    crossings = straddles & (px < crossX)
+    return np.logical_xor.reduce(crossings, axis=0)
+
+class CanvasItem:
+    """
+    A canvas item as Tk stores it: a kind, a flat coordinate list and the
+    options that matter for drawing it.
+    """
+    __slots__ = ('kind', 'coords', 'fill', 'outline', 'width', 'start', 'extent', 'style', 'smooth', 'tile')
+
+    def __init__(self, kind, coords, fill=None, outline=None, width=1, start=0.0, extent=360.0, style=None, smooth=False, tile=None):
+        self.kind = kind
+        self.coords = coords
+        self.fill = fill
+        self.outline = outline
+        self.width = width
+        self.start = start
+        self.extent = extent
+        self.style = style
+        self.smooth = smooth
+        self.tile = tile
+
+    def bounds(self):
+        if self.kind == 'text':
+            return None
+        if self.kind == 'sprite':
+            x, y = self.coords
+            height, width = self.tile[1].shape
+            return x, y, x + width - 1, y + height - 1
+        xs = self.coords[0::2]
+        ys = self.coords[1::2]
+        pad = max(self.width, 1) / 2.0 + 1
+        return min(xs) - pad, min(ys) - pad, max(xs) + pad, max(ys) + pad
+
+    def masks(self, px, py):
+        """
+        Returns (mask, colour) layers over the pixel centres px (1xW) and py
+        (Hx1), in the order Tk paints them.
+        """
+        half = max(self.width, 1) / 2.0
+        layers = []
+        if self.kind == 'line':
+            x0, y0, x1, y1 = self.coords
+            if self.fill is not None:
+                layers.append((_segmentMask(px, py, x0, y0, x1, y1, half, True), self.fill))
+        elif self.kind == 'polygon':
+            points = np.array(self.coords, dtype=np.float64).reshape(-1, 2)
+            if self.smooth and len(points) > 2:
+                points = smoothPolygon(points)
+            if self.fill is not None:
+                layers.append((_polygonMask(points, px, py), self.fill))
+            if self.outline is not None:
+                layers.append((_outlineMask(points, px, py, half), self.outline))
+        elif self.kind == 'arc':
+            x0, y0, x1, y1 = self.coords
+            cx, cy = (x0 + x1) / 2.0, (y0 + y1) / 2.0
+            rx, ry = max((x1 - x0) / 2.0, 1e-6), max((y1 - y0) / 2.0, 1e-6)
+            r = (rx + ry) / 2.0
+            dx, dy = px - cx, py - cy
+            dist = np.sqrt((dx / rx) ** 2 + (dy / ry) ** 2) * r
+            inAngle = _angleMask(dx, dy, self.start, self.extent)
+            pieslice = self.style == 'pieslice'
+            if pieslice and self.fill is not None:
+                layers.append(((dist <= r) & inAngle, self.fill))
+            if self.outline is not None:
+                outline = (np.abs(dist - r) <= half) & inAngle
+                if pieslice and self.extent < 360:
+                    for angle in (self.start, self.start + self.extent):
+                        ex = cx + rx * math.cos(math.radians(angle))
+                        ey = cy - ry * math.sin(math.radians(angle))
+                        outline |= _segmentMask(px, py, cx, cy, ex, ey, half, False)
+                layers.append((outline, self.outline))
+        return layers
+
+def pixelBox(bounds, shape, ox=0.0, oy=0.0):
+    """
+    Converts canvas bounds to the (i0, i1, j0, j1) rows and columns they
+    cover in an array of the given shape whose pixel (0, 0) sits at canvas
+    coordinates (ox, oy).  Returns None when nothing is covered.
+    """
+    x0, y0, x1, y1 = bounds
+    height, width = shape[:2]
+    j0, j1 = max(int(math.floor(x0 - ox)), 0), min(int(math.ceil(x1 - ox)) + 1, width)
+    i0, i1 = max(int(math.floor(y0 - oy)), 0), min(int(math.ceil(y1 - oy)) + 1, height)
+    if j0 >= j1 or i0 >= i1:
+        return None
+    return i0, i1, j0, j1
+
+def drawItem(item, out, ox=0.0, oy=0.0):
+    """
+    Rasterises a single item into out, whose pixel (0, 0) sits at canvas
+    coordinates (ox, oy).
+    """
+    bounds = item.bounds()
+    if bounds is None:
+        return
+    box = pixelBox(bounds, out.shape, ox, oy)
+    if box is None:
+        return
+    i0, i1, j0, j1 = box
+    if item.kind == 'sprite':
+        rgb, mask = item.tile
+        x, y = item.coords
+        ti, tj = int(i0 + oy - y), int(j0 + ox - x)
+        mask = mask[ti:ti + i1 - i0, tj:tj + j1 - j0]
+        np.copyto(out[i0:i1, j0:j1], rgb[ti:ti + i1 - i0, tj:tj + j1 - j0], where=mask[:, :, None])
+        return
+    px = (np.arange(j0, j1) + (ox + 0.5))[None, :]
+    py = (np.arange(i0, i1) + (oy + 0.5))[:, None]
+    region = out[i0:i1, j0:j1]
+    for mask, color in item.masks(px, py):
+        region[mask] = color
+
+def _resizeWeights(size, newSize):
+    centers = (np.arange(newSize) + 0.5) * (float(size) / newSize) - 0.5
+    centers = np.clip(centers, 0, size - 1)
+    low = np.floor(centers).astype(np.intp)
+    high = np.minimum(low + 1, size - 1)
+    return low, high, (centers - low).astype(np.float32)
+
+def _fullWeights(weights, shape):
+    return np.ascontiguousarray(np.broadcast_to(weights, shape))
+
+class ImageResizer:
+    """
+    Bilinear resize of HxWx3 uint8 images of one shape to size = (width,
+    height), the NumPy counterpart of PIL's Image.resize.  The weights and
+    the float32 scratch arrays are made once, so resize allocates nothing
+    when given out.
+    """
+    def __init__(self, shape, size):
+        self.shape = tuple(shape)
+        self.size = tuple(size)
+        width, height = size
+        self.top, self.bottom, fy = _resizeWeights(shape[0], height)
+        self.left, self.right, fx = _resizeWeights(shape[1], width)
+        # only the rows that are sampled get converted to float
+        self.sampledRows = np.empty((height,) + self.shape[1:], dtype=np.uint8)
+        self.rows = np.empty(self.sampledRows.shape, dtype=np.float32)
+        self.rowScratch = np.empty(self.sampledRows.shape, dtype=np.float32)
+        self.resized = np.empty((height, width) + self.shape[2:], dtype=np.float32)
+        self.columnScratch = np.empty(self.resized.shape, dtype=np.float32)
+        # weights spelled out to the full shape: ufuncs buffer broadcast operands
+        self.topWeights = _fullWeights((1 - fy)[:, None, None], self.rows.shape)
+        self.bottomWeights = _fullWeights(fy[:, None, None], self.rows.shape)
+        self.leftWeights = _fullWeights((1 - fx)[None, :, None], self.resized.shape)
+        self.rightWeights = _fullWeights(fx[None, :, None], self.resized.shape)
+
+    def resize(self, image, out=None):
+        """
+        Resizes image (of the resizer's shape) into out, a (height, width, 3)
+        uint8 array, or a new array.
+        """
+        # mode='clip' keeps take from buffering out; the indices are in range
+        rows, scratch = self.rows, self.rowScratch
+        np.take(image, self.top, axis=0, out=self.sampledRows, mode='clip')
+        np.copyto(rows, self.sampledRows)
+        np.multiply(rows, self.topWeights, out=rows)
+        np.take(image, self.bottom, axis=0, out=self.sampledRows, mode='clip')
+        np.copyto(scratch, self.sampledRows)
+        np.multiply(scratch, self.bottomWeights, out=scratch)
+        np.add(rows, scratch, out=rows)
+
+        resized, scratch = self.resized, self.columnScratch
+        np.take(rows, self.left, axis=1, out=resized, mode='clip')
+        np.multiply(resized, self.leftWeights, out=resized)
+        np.take(rows, self.right, axis=1, out=scratch, mode='clip')
+        np.multiply(scratch, self.rightWeights, out=scratch)
+        np.add(resized, scratch, out=resized)
+        np.rint(resized, out=resized)
+        if out is None:
+            return resized.astype(np.uint8)
+        np.copyto(out, resized, casting='unsafe')
+        return out
+
+def resizeImage(image, size, out=None):
+    """
+    One-off ImageResizer(image.shape, size).resize(image, out); keep an
+    ImageResizer to resize many images of the same shape.
+    """
+    return ImageResizer(image.shape, size).resize(image, out)
+
+def cropImage(image, box, out=None):
+    """
+    Crops image to box = (left, upper, right, lower), padding with black
+    outside the image like PIL's Image.crop.  Writes into out (of the box's
+    size) when given.
+    """
+    left, upper, right, lower = box
+    height, width = image.shape[:2]
+    x0, x1 = max(left, 0), min(right, width)
+    y0, y1 = max(upper, 0), min(lower, height)
+    if out is None:
+        out = np.zeros((lower - upper, right - left) + image.shape[2:], dtype=image.dtype)
+    elif (x0, x1, y0, y1) != (left, right, upper, lower):
+        out[...] = 0
+    if x0 < x1 and y0 < y1:
+        out[y0 - upper:y1 - upper, x0 - left:x1 - left] = image[y0:y1, x0:x1]
+    return out
+
+class NumpyGraphicsUtils:
+    """
+    Implements the drawing API of GraphicsUtils on top of an in-memory list
+    of canvas items.  image() returns the rasterised canvas as an HxWx3
+    uint8 array; the array is reused between frames.
+
+    Items that never change can be flattened into a background array with
+    flatten(); frames then start from a copy of the background and only the
+    remaining items are rasterised on top of it.
+    """
+    def __init__(self):
+        self._items = {}
+        self._nextId = 1
+        self._frame = None
+        self._window = None
+        self._background = None
+        self._canvas_xs = None
+        self._canvas_ys = None
+        self._canvas_x = None
+        self._canvas_y = None
+        self._bg_color = None
+
+    def sleep(self, secs):
+        time.sleep(secs)
+
+    def begin_graphics(self, width=640, height=480, color='#000000', title=None):
+        self._canvas_xs, self._canvas_ys = width - 1, height - 1
+        self._canvas_x, self._canvas_y = 0, self._canvas_ys
+        self._bg_color = parseColor(color)
+
+        shape = (int(round(height)), int(round(width)), 3)
+        if self._frame is None or self._frame.shape != shape:
+            self._frame = np.empty(shape, dtype=np.uint8)
+        self._items = {}
+        self._nextId = 1
+        self._background = None
+        self.draw_background()
+
+    def draw_background(self):
+        # image() paints the background colour itself; the id is still used
+        # up so item ids (and 'behind' references) line up with Tk's
+        self._nextId += 1
+
+    def end_graphics(self):
+        self._items = {}
+        self._frame = None
+        self._background = None
+
+    def clear_screen(self, background=None):
+        self._items = {}
+        self._background = None
+        self.draw_background()
+        self._canvas_x, self._canvas_y = 0, self._canvas_ys
+
+    def _addItem(self, item):
+        id = self._nextId
+        self._nextId += 1
+        self._items[id] = item
+        return id
+
+    def _lower(self, id, belowThis):
+        if belowThis not in self._items:
+            return
+        item = self._items.pop(id)
+        items = {}
+        for key, value in self._items.items():
+            if key == belowThis:
+                items[id] = item
+            items[key] = value
+        self._items = items
+
+    def polygon(self, coords, outlineColor, fillColor=None, filled=1, smoothed=1, behind=0, width=1):
+        c = []
+        for coord in coords:
+            c.append(coord[0])
+            c.append(coord[1])
+        if fillColor == None: fillColor = outlineColor
+        if filled == 0: fillColor = ""
+        poly = self._addItem(CanvasItem('polygon', c, fill=parseColor(fillColor),
+                                        outline=parseColor(outlineColor), width=width, smooth=bool(smoothed)))
+        if behind > 0:
+            self._lower(poly, behind)
+        return poly
+
+    def square(self, pos, r, color, filled=1, behind=0):
+        x, y = pos
+        coords = [(x - r, y - r), (x + r, y - r), (x + r, y + r), (x - r, y + r)]
+        return self.polygon(coords, color, color, filled, 0, behind=behind)
+
+    def circle(self, pos, r, outlineColor, fillColor, endpoints=None, style='pieslice', width=2):
+        x, y = pos
+        x0, x1 = x - r - 1, x + r
+        y0, y1 = y - r - 1, y + r
+        if endpoints == None:
+            e = [0, 359]
+        else:
+            e = list(endpoints)
+        while e[0] > e[1]: e[1] = e[1] + 360
+
+        return self._addItem(CanvasItem('arc', [x0, y0, x1, y1], fill=parseColor(fillColor),
+                                        outline=parseColor(outlineColor), width=width,
+                                        start=e[0], extent=e[1] - e[0], style=style))
+
+    def image(self, viewport=None):
+        """
+        Rasterises the canvas.  viewport = (left, top, width, height), in
+        integer canvas pixels, renders just that window into a separate
+        buffer; items outside it are skipped and areas beyond the canvas
+        are left in the background colour.
+        """
+        if viewport is None:
+            frame = self._frame
+            ox = oy = 0
+        else:
+            ox, oy, width, height = viewport
+            if self._window is None or self._window.shape[:2] != (height, width):
+                self._window = np.empty((height, width, 3), dtype=np.uint8)
+            frame = self._window
+
+        if self._background is not None and viewport is None:
+            np.copyto(frame, self._background)
+        else:
+            frame[...] = self._bg_color
+            if self._background is not None:
+                box = pixelBox((ox, oy, ox + frame.shape[1] - 1, oy + frame.shape[0] - 1), self._background.shape)
+                if box is not None:
+                    i0, i1, j0, j1 = box
+                    frame[i0 - oy:i1 - oy, j0 - ox:j1 - ox] = self._background[i0:i1, j0:j1]
+        for item in self._items.values():
+            drawItem(item, frame, ox, oy)
+        return frame
+
+    def flatten(self):
+        """
+        Rasterises every current item on top of the background, makes the
+        result the new background and removes the items.  Returns the new
+        background array.
+        """
+        background = np.empty_like(self._frame)
+        if self._background is not None:
+            np.copyto(background, self._background)
+        else:
+            background[...] = self._bg_color
+        for item in self._items.values():
+            drawItem(item, background)
+        self._items = {}
+        self._background = background
+        return background
+
+    def setBackground(self, background):
+        """
+        Uses background (an array shaped like the frame) as the layer every
+        frame starts from.  The array is read, not copied.
+        """
+        self._background = background
+
+    def restoreBackground(self, box, source):
+        """
+        Copies the (i0, i1, j0, j1) pixel box of source into the background,
+        erasing whatever was flattened there.
+        """
+        i0, i1, j0, j1 = box
+        self._background[i0:i1, j0:j1] = source[i0:i1, j0:j1]
+
+    def itemBox(self, id):
+        """
+        Returns the (i0, i1, j0, j1) pixel box an item covers in the frame.
+        """
+        return pixelBox(self._items[id].bounds(), self._frame.shape)
+
+    def sprite(self, pos, tile):
+        """
+        Places a pre-rendered tile = (rgb, mask) with its top-left pixel at
+        the integer canvas position pos.  Only pixels under the mask are
+        drawn.
+        """
+        x, y = pos
+        return self._addItem(CanvasItem('sprite', [x, y], tile=tile))
+
+    def moveSprite(self, id, pos, tile):
+        item = self._items[id]
+        item.coords = list(pos)
+        item.tile = tile
+
+    def refresh(self):
+        pass
+
+    def moveCircle(self, id, pos, r, endpoints=None):
+        x, y = pos
+        x0, x1 = x - r - 1, x + r
+        y0, y1 = y - r - 1, y + r
+        if endpoints == None:
+            e = [0, 359]
+        else:
+            e = list(endpoints)
+        while e[0] > e[1]: e[1] = e[1] + 360
+
+        self.edit(id, ('start', e[0]), ('extent', e[1] - e[0]))
+        self.move_to(id, x0, y0)
+
+    def edit(self, id, *args):
+        item = self._items[id]
+        for key, value in args:
+            if key in ('fill', 'outline'):
+                value = parseColor(value)
+            setattr(item, key, value)
+
+    def text(self, pos, color, contents, font='Helvetica', size=12, style='normal', anchor="nw"):
+        # Text is tracked so ids stay valid, but it is not rasterised
+        x, y = pos
+        return self._addItem(CanvasItem('text', [x, y], fill=parseColor(color)))
+
+    def changeText(self, id, newText, font=None, size=12, style='normal'):
+        pass
+
+    def changeColor(self, id, newColor):
+        self._items[id].fill = parseColor(newColor)
+
+    def line(self, here, there, color='#000000', width=2):
+        x0, y0 = here[0], here[1]
+        x1, y1 = there[0], there[1]
+        return self._addItem(CanvasItem('line', [x0, y0, x1, y1], fill=parseColor(color), width=width))
+
+    def remove_from_screen(self, x):
+        self._items.pop(x, None)
+
+    def move_to(self, object, x, y=None):
+        if y is None:
+            try: x, y = x
+            except: raise Exception('incomprehensible coordinates')
+
+        item = self._items[object]
+        current_x, current_y = item.coords[0:2] # first point
+        self._shift(item, x - current_x, y - current_y)
+
+    def move_by(self, object, x, y=None, lift=False):
+        if y is None:
+            try: x, y = x
+            except: raise Exception('incomprehensible coordinates')
+
+        item = self._items[object]
+        self._shift(item, x, y)
+        if lift:
+            self._items[object] = self._items.pop(object)
+
+    def _shift(self, item, dx, dy):
+        coords = item.coords
+        for i in range(0, len(coords), 2):
+            coords[i] += dx
+            coords[i + 1] += dy
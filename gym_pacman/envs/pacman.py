@@ -39,15 +39,35 @@ code to run a game.  This file is divided into three sections:
 To play your first game, type 'python pacman.py' from the command line.
 The keys are 'a', 's', 'd', and 'w' to move (or arrow keys).  Have fun!
 """
-from .game import GameStateData, Game, Directions, Actions
+from .game import GameStateData, Game, Directions, Actions, Configuration
 from .util import nearestPoint, manhattanDistance
 from .layout import getLayout
 import sys, types, time, random, os
+import contextlib
 
 ###################################################
 # YOUR INTERFACE TO THE PACMAN WORLD: A GameState #
 ###################################################
 
+class ExploredTracker:
+    """
+    Expansion bookkeeping for GameState.trackExplored: a count of successors
+    generated and the set of states involved, capped at limit states.
+    """
+    def __init__( self, limit=None ):
+        self.limit = limit
+        self.reset()
+
+    def reset( self ):
+        self.states = set()
+        self.numExpanded = 0
+
+    def add( self, state, successor ):
+        self.numExpanded += 1
+        if self.limit is None or len(self.states) < self.limit:
+            self.states.add(state)
+            self.states.add(successor)
+
 class GameState:
     """
     A GameState specifies the full game state, including the food, capsules,
@@ -67,14 +87,39 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
-    explored = set()
+    # static variable keeps track of which states generateSuccessor has seen,
+    # while an ExploredTracker is installed (see trackExplored); off otherwise
+    explored = None
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
-        GameState.explored = set()
+        """
+        The states recorded since the last call (an empty set when tracking
+        is off), starting a fresh record.
+        """
+        if GameState.explored is None: return set()
+        tmp = GameState.explored.states
+        GameState.explored.reset()
         return tmp
     getAndResetExplored = staticmethod(getAndResetExplored)
 
+    def trackExplored( limit=None ):
+        """
+        Context manager that records explored states while it is active:
+
+          with GameState.trackExplored(limit=10000) as explored:
+              ...
+          print(explored.numExpanded, len(explored.states))
+
+        At most limit states are kept (None for no limit, 0 to only count);
+        numExpanded counts every generateSuccessor call regardless.
+        """
+        previous = GameState.explored
+        GameState.explored = ExploredTracker( limit )
+        try:
+            yield GameState.explored
+        finally:
+            GameState.explored = previous
+    trackExplored = staticmethod( contextlib.contextmanager( trackExplored ) )
+
     def getLegalActions( self, agentIndex=0 ):
         """
         Returns the legal actions for the agent specified.
@@ -100,6 +145,7 @@ class GameState:
         # Let agent's logic deal with its action's effects on the board
         if agentIndex == 0:  # Pacman is moving
             state.data._eaten = [False for i in range(state.getNumAgents())]
+            state.data._ownEaten = True
             PacmanRules.applyAction( state, action )
         else:                # A ghost is moving
             GhostRules.applyAction( state, action, agentIndex )
@@ -108,7 +154,7 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
         else:
-            GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
+            GhostRules.decrementTimer( state.data.getMutableAgentState( agentIndex ) )
 
         # Resolve multi-agent effects
         GhostRules.checkDeath( state, agentIndex )
@@ -116,8 +162,8 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        if GameState.explored is not None:
+            GameState.explored.add(self, state)
         return state
 
     def getLegalPacmanActions( self ):
@@ -170,7 +216,10 @@ class GameState:
         return self.data.capsules
 
     def getNumFood( self ):
-        return self.data.food.count()
+        return self.data.numFood
+
+    def getNumCapsules( self ):
+        return self.data.numCapsules
 
     def getFood(self):
         """
@@ -327,7 +376,8 @@ class PacmanRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions( state.getPacmanState().configuration, state.data.layout.walls )
+        layout = state.data.layout
+        return Actions.getPossibleActions( state.data.agentStates[0].configuration, layout.walls, layout.getActionTable() )
     getLegalActions = staticmethod( getLegalActions )
 
     def applyAction( state, action ):
@@ -338,7 +388,7 @@ class PacmanRules:
         if action not in legal:
             raise Exception("Illegal action " + str(action))
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data.getMutableAgentState( 0 )
 
         # Update Configuration
         vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
@@ -357,21 +407,18 @@ class PacmanRules:
         # Eat food
         if state.data.food[x][y]:
             state.data.scoreChange += 10
-            state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
+            state.data.eatFood( position )
             state.data._foodEaten = position
-            # TODO: cache numFood?
-            numFood = state.getNumFood()
-            if numFood == 0 and not state.data._lose:
+            if state.data.numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if( position in state.getCapsules() ):
-            state.data.capsules.remove( position )
+            state.data.eatCapsule( position )
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range( 1, len( state.data.agentStates ) ):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.getMutableAgentState( index ).scaredTimer = SCARED_TIME
     consume = staticmethod( consume )
 
 class GhostRules:
@@ -385,7 +432,8 @@ class GhostRules:
         reach a dead end, but can turn 90 degrees at intersections.
         """
         conf = state.getGhostState( ghostIndex ).configuration
-        possibleActions = Actions.getPossibleActions( conf, state.data.layout.walls )
+        layout = state.data.layout
+        possibleActions = Actions.getPossibleActions( conf, layout.walls, layout.getActionTable() )
         reverse = Actions.reverseDirection( conf.direction )
         if reverse in possibleActions and len( possibleActions ) > 1:
             possibleActions.remove( reverse )
@@ -398,7 +446,7 @@ class GhostRules:
         if action not in legal:
             raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data.getMutableAgentState( ghostIndex )
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
         vector = Actions.directionToVector( action, speed )
@@ -408,7 +456,8 @@ class GhostRules:
     def decrementTimer( ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
+            # Configurations are shared between copies of an AgentState
+            ghostState.configuration = Configuration( nearestPoint( ghostState.configuration.pos ), ghostState.configuration.direction )
         ghostState.scaredTimer = max( 0, timer - 1 )
     decrementTimer = staticmethod( decrementTimer )
 
@@ -419,12 +468,12 @@ class GhostRules:
                 ghostState = state.data.agentStates[index]
                 ghostPosition = ghostState.configuration.getPosition()
                 if GhostRules.canKill( pacmanPosition, ghostPosition ):
-                    GhostRules.collide( state, ghostState, index )
+                    GhostRules.collide( state, state.data.getMutableAgentState( index ), index )
         else:
             ghostState = state.data.agentStates[agentIndex]
             ghostPosition = ghostState.configuration.getPosition()
             if GhostRules.canKill( pacmanPosition, ghostPosition ):
-                GhostRules.collide( state, ghostState, agentIndex )
+                GhostRules.collide( state, state.data.getMutableAgentState( agentIndex ), agentIndex )
     checkDeath = staticmethod( checkDeath )
 
     def collide( state, ghostState, agentIndex):
@@ -433,7 +482,7 @@ class GhostRules:
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
             # Added for first-person
-            state.data._eaten[agentIndex] = True
+            state.data.getMutableEaten()[agentIndex] = True
         else:
             if not state.data._win:
                 state.data.scoreChange -= 500
@@ -4,16 +4,20 @@ from gym.utils import seeding
 import numpy as np
 
 from .graphicsDisplay import PacmanGraphics, DEFAULT_GRID_SIZE
+from .numpyGraphicsUtils import cropImage, ImageResizer
+from .textDisplay import NullGraphics
+from .gridObservations import GRID_CHANNELS, getGridObservation, getEgocentricGridObservation
 
 from .game import Actions
 from .pacman import ClassicGameRules
-from .layout import getLayout, getRandomLayout
+from .layout import getLayout, getRandomLayout, LayoutBank, randint
 
 from .ghostAgents import DirectionalGhost
 from .pacmanAgents import OpenAIAgent
 
 from gym.utils import seeding
 
+import collections
 import json
 import os
 
@@ -29,6 +33,27 @@ ROTATION_ANGLES = [0, 180, 90, 270]
 
 MAX_EP_LENGTH = 100
 
+# 'image' renders the whole maze, then crops and resizes the area around
+# Pacman; 'egocentric' rasterises only the cells around Pacman, directly at
+# the observation resolution; 'grid' and 'egocentric_grid' are the symbolic
+# (channel, row, column) planes of gridObservations, with no rendering at all
+OBSERVATION_MODES = ['image', 'egocentric', 'grid', 'egocentric_grid']
+GRID_OBSERVATION_MODES = ['grid', 'egocentric_grid']
+OBSERVATION_SIZE = 84
+EGOCENTRIC_RADIUS = 1 # 3x3 cells
+
+# 'full' returns the dict of one-element lists step always returned;
+# 'minimal' returns PacmanEnv.infoRecord, one INFO_DTYPE record rewritten in
+# place every step; 'none' returns an empty dict and skips the ghost
+# bookkeeping
+INFO_LEVELS = ['none', 'minimal', 'full']
+# missing ghosts are NaN; episode_r / episode_l are 0 until done
+INFO_DTYPE = np.dtype([('past_loc', np.int32, (2,)), ('curr_loc', np.int32, (2,)),
+                       ('past_orientation', np.int8), ('curr_orientation', np.int8),
+                       ('illegal_move_counter', np.int32), ('step_counter', np.int32),
+                       ('ghost_positions', np.float64, (MAX_GHOSTS, 2)), ('ghost_in_frame', bool),
+                       ('episode_r', np.float32), ('episode_l', np.int32)])
+
 import os
 fdir = '/'.join(os.path.split(__file__)[:-1])
 print(fdir)
@@ -40,6 +65,30 @@ for k in layout_params:
     print(k,":",layout_params[k])
 print("------------------")
 
+class LazyObservation:
+    """
+    What PacmanEnv returns as the observation with lazy_observations: the
+    frame is only rendered when something reads it through __array__
+    (np.asarray(obs), or any NumPy function).  Read it before the env's
+    next step or reset; after that it raises, unless it was read in time.
+    If the step was given an out buffer, reading fills that.
+    """
+    def __init__(self, env, out=None):
+        self.env = env
+        self.version = env.observationVersion
+        self.out = out
+        self.array = None
+
+    def __array__(self, dtype=None, copy=None):
+        if self.array is None:
+            if self.env.observationVersion != self.version:
+                raise Exception('Lazy observation read after the env moved on; read it before the next step or reset')
+            self.array = self.env._get_observation(self.out)
+        if dtype is None:
+            dtype = self.array.dtype
+        # without copy, astype hands back self.array itself when it can
+        return self.array.astype(dtype, copy=bool(copy))
+
 class PacmanEnv(gym.Env):
     layouts = [
         'capsuleClassic', 'contestClassic', 'mediumClassic', 'mediumGrid', 'minimaxClassic', 'openClassic', 'originalClassic', 'smallClassic', 'capsuleClassic', 'smallGrid', 'testClassic', 'trappedClassic', 'trickyClassic'
@@ -53,17 +102,90 @@ class PacmanEnv(gym.Env):
     observation_space = spaces.Box(low=0, high=255,
             shape=(84, 84, 3), dtype=np.uint8)
 
-    def __init__(self):
+    def __init__(self, renderer='tk', cache_background=False, cache_food=False,
+        observation_mode='image', sprite_atlas=False, layout_bank_size=0,
+        layout_dataset=None, lazy_observations=False, frameskip=1,
+        frameskip_max_pool=False, info_level='full'):
+        # renderer: 'tk' (Tk canvas + PostScript) or 'numpy' (headless)
+        # cache_background / cache_food: reuse rasterised walls (and initial
+        # food) across resets on the same layout; numpy renderer only
+        # sprite_atlas: blit pre-rendered agent / food tiles; numpy renderer only
+        # layout_bank_size: if > 0, draw random layouts from a LayoutBank of
+        # that many layouts, refilled in the background
+        # layout_dataset: path of a layoutDataset file to draw random layouts
+        # from instead of generating them
+        # observation_mode: one of OBSERVATION_MODES; 'egocentric' always
+        # uses the numpy renderer, the grid modes don't render
+        # lazy_observations: reset and step return a LazyObservation, and
+        # the display only draws when one is read (or on render())
+        # frameskip: game moves each step repeats the action for, summing
+        # the rewards; frameskip_max_pool returns the elementwise max of the
+        # last two frames instead of the last one
+        # info_level: one of INFO_LEVELS
+        if observation_mode not in OBSERVATION_MODES:
+            raise Exception('Unknown observation mode ' + str(observation_mode))
+        if info_level not in INFO_LEVELS:
+            raise Exception('Unknown info level ' + str(info_level))
+        self.info_level = info_level
+        # a 0-d array, so it can be a row of a vector env's columns
+        self.infoRecord = np.zeros((), dtype=INFO_DTYPE)
+        # the histories only need to reach back one step (frameskip moves)
+        self.historyLength = frameskip + 1
+        self.observation_mode = observation_mode
+        self.frameskip = frameskip
+        self.frameskip_max_pool = frameskip_max_pool
+        self.previousFrame = None
+        # buffers reused from step to step
+        self.poolBuffer = None
+        self.cropBuffer = None
+        self.resizer = None
+        self.terminalObservation = None
+        # intermediate frames of a frameskip are never looked at
+        deferred = lazy_observations or frameskip > 1
         self.action_space = spaces.Discrete(4) # up, down, left right
-        self.display = PacmanGraphics(1.0)
+        if observation_mode == 'egocentric':
+            # cell size chosen so the window maps straight onto the observation
+            window = 2 * EGOCENTRIC_RADIUS + 1
+            zoom = OBSERVATION_SIZE / float(window * DEFAULT_GRID_SIZE)
+            self.display = PacmanGraphics(zoom, renderer='numpy',
+                cacheBackground=cache_background, cacheFood=cache_food,
+                windowRadius=EGOCENTRIC_RADIUS, spriteAtlas=sprite_atlas,
+                deferred=deferred)
+        elif observation_mode in GRID_OBSERVATION_MODES:
+            self.display = NullGraphics()
+        else:
+            self.display = PacmanGraphics(1.0, renderer=renderer,
+                cacheBackground=cache_background, cacheFood=cache_food,
+                spriteAtlas=sprite_atlas, deferred=deferred)
+        self.lazy_observations = lazy_observations
+        self.observationVersion = 0 # bumped whenever the game moves on
         self._action_set = range(len(PACMAN_ACTIONS))
         self.location = None
         self.viewer = None
         self.done = False
         self.layout = None
         self.np_random = None
+        self.layout_bank_size = layout_bank_size
+        self.layoutBank = None
+        self.layoutDataset = None
+        if layout_dataset is not None:
+            # imported here so python -m gym_pacman.envs.layoutDataset doesn't
+            # find the module already loaded by the package
+            from .layoutDataset import LayoutDataset
+            self.layoutDataset = LayoutDataset(layout_dataset)
 
     def setObservationSpace(self):
+        if self.observation_mode == 'egocentric':
+            return # fixed size, see the class attribute
+        if self.observation_mode == 'grid':
+            self.observation_space = spaces.Box(low=0, high=1,
+                shape=(len(GRID_CHANNELS), self.layout.height, self.layout.width), dtype=np.uint8)
+            return
+        if self.observation_mode == 'egocentric_grid':
+            window = 2 * EGOCENTRIC_RADIUS + 1
+            self.observation_space = spaces.Box(low=0, high=1,
+                shape=(len(GRID_CHANNELS), window, window), dtype=np.uint8)
+            return
         screen_width, screen_height = self.display.calculate_screen_dimensions(self.layout.width,   self.layout.height)
         self.observation_space = spaces.Box(low=0, high=255,
             shape=(int(screen_height),
@@ -73,7 +195,15 @@ class PacmanEnv(gym.Env):
     def chooseLayout(self, randomLayout=True,
         chosenLayout=None, no_ghosts=True):
 
-        if randomLayout:
+        if randomLayout and self.layoutDataset is not None:
+            self.layout = self.layoutDataset[randint(self.np_random, 0, len(self.layoutDataset))]
+        elif randomLayout and self.layout_bank_size > 0:
+            if self.layoutBank is None:
+                # seeded from np_random, so a seeded env gets the same layouts
+                self.layoutBank = LayoutBank(layout_params, self.layout_bank_size,
+                    seed=int(randint(self.np_random, 0, 2**31)))
+            self.layout = self.layoutBank.draw()
+        elif randomLayout:
             self.layout = getRandomLayout(layout_params, self.np_random)
         else:
             if chosenLayout is None:
@@ -87,12 +217,19 @@ class PacmanEnv(gym.Env):
         self.maze_size = (self.layout.width, self.layout.height)
 
     def seed(self, seed=None):
-        if self.np_random is None:
-            self.np_random, seed = seeding.np_random(seed)
+        # gym's np_random property makes an unseeded generator when first
+        # read, so always replace it
+        self.np_random, seed = seeding.np_random(seed)
+        if self.layoutBank is not None:
+            # drawn from the old stream; rebuilt from the new one
+            self.layoutBank.close()
+            self.layoutBank = None
         self.chooseLayout(randomLayout=True)
         return [seed]
 
-    def reset(self, layout=None):
+    def reset(self, layout=None, out=None):
+        # out: optional uint8 array the observation is written into, and
+        # returned (see _get_image)
         # get new layout
         #if self.layout is None:
         #    self.chooseLayout(randomLayout=True)
@@ -117,22 +254,22 @@ class PacmanEnv(gym.Env):
         self.game = self.rules.newGame(self.layout, self.pacman, self.ghosts,
             self.display, False, False)
 
-        self.game.init()
+        self.game.init() # initializes the display too
 
-        self.display.initialize(self.game.state.data)
         self.display.updateView()
 
         self.location = self.game.state.data.agentStates[0].getPosition()
         self.ghostLocations = [a.getPosition() for a in self.game.state.data.agentStates[1:]]
         self.ghostInFrame = any([np.sum(np.abs(np.array(g) - np.array(self.location))) <= 2 for g in self.ghostLocations])
 
-        self.location_history = [self.location]
+        self.location_history = collections.deque([self.location], self.historyLength)
         self.orientation = PACMAN_DIRECTIONS.index(self.game.state.data.agentStates[0].getDirection())
-        self.orientation_history = [self.orientation]
+        self.orientation_history = collections.deque([self.orientation], self.historyLength)
         self.illegal_move_counter = 0
 
         self.cum_reward = 0
 
+        self._fillInfoRecord(0)
         self.initial_info = {
             'past_loc': [self.location_history[-1]],
             'curr_loc': [self.location_history[-1]],
@@ -144,13 +281,19 @@ class PacmanEnv(gym.Env):
             'step_counter': [[0]],
         }
 
-        return self._get_image()
+        self.observationVersion += 1
+        self.previousFrame = self.poolBuffer = None # the maze size may have changed
+        return self._observation(out)
 
-    def step(self, action):
+    def step(self, action, out=None):
         # implement code here to take an action
+        # out: optional uint8 array the observation is written into, and
+        # returned, instead of a new array
         if self.step_counter >= MAX_EP_LENGTH or self.done:
             self.step_counter += 1
-            return np.zeros(self.observation_space.shape), 0.0, True, {
+            if self.info_level != 'full':
+                return self._terminalObservation(out), 0.0, True, self._info(1)
+            return self._terminalObservation(out), 0.0, True, {
                 'past_loc': [self.location_history[-2]],
                 'curr_loc': [self.location_history[-1]],
                 'past_orientation': [[self.orientation_history[-2]]],
@@ -168,8 +311,79 @@ class PacmanEnv(gym.Env):
             }
 
 
-        pacman_action = PACMAN_ACTIONS[action]
+        reward, steps = self._repeatAction(PACMAN_ACTIONS[action])
+        if self.info_level != 'full':
+            return self._observation(out), reward, self.done, self._info(steps)
+
+        info = {
+            'past_loc': [self.location_history[-1 - steps]],
+            'curr_loc': [self.location_history[-1]],
+            'past_orientation': [[self.orientation_history[-1 - steps]]],
+            'curr_orientation': [[self.orientation_history[-1]]],
+            'illegal_move_counter': [self.illegal_move_counter],
+            'step_counter': [[self.step_counter]],
+            'episode': [None],
+            'ghost_positions': [self.ghostLocations],
+            'ghost_in_frame': [self.ghostInFrame],
+        }
 
+        if self.done: # only if done, send 'episode' info
+            info['episode'] = [{
+                'r': self.cum_reward,
+                'l': self.step_counter
+            }]
+        return self._observation(out), reward, self.done, info
+
+    def _info(self, steps):
+        # the info of the 'none' and 'minimal' levels
+        if self.info_level == 'none':
+            return {}
+        self._fillInfoRecord(steps)
+        return self.infoRecord
+
+    def _fillInfoRecord(self, steps):
+        """
+        Writes the current info into infoRecord, with past_* taken from
+        steps moves back.
+        """
+        record = self.infoRecord
+        record['past_loc'] = self.location_history[-1 - steps]
+        record['curr_loc'] = self.location
+        record['past_orientation'] = self.orientation_history[-1 - steps]
+        record['curr_orientation'] = self.orientation
+        record['illegal_move_counter'] = self.illegal_move_counter
+        record['step_counter'] = self.step_counter
+        ghosts = record['ghost_positions']
+        ghosts[:len(self.ghostLocations)] = self.ghostLocations
+        ghosts[len(self.ghostLocations):] = np.nan
+        record['ghost_in_frame'] = self.ghostInFrame
+        if self.done:
+            record['episode_r'] = self.cum_reward
+            record['episode_l'] = self.step_counter
+        else:
+            record['episode_r'] = record['episode_l'] = 0
+
+    def _repeatAction(self, pacman_action):
+        """
+        Plays pacman_action for frameskip moves, stopping when the episode
+        ends; returns the summed reward and the number of moves played.
+        Only the frames that are returned get rendered.
+        """
+        self.previousFrame = None
+        reward = 0.0
+        for repeat in range(self.frameskip):
+            reward += self._stepGame(pacman_action)
+            if self.done:
+                break
+            if self.frameskip_max_pool and repeat == self.frameskip - 2:
+                self.previousFrame = self.poolBuffer = self._get_image(self.poolBuffer)
+        return reward, repeat + 1
+
+    def _stepGame(self, pacman_action):
+        """
+        One move of the game (Pacman, then the ghosts) and its bookkeeping;
+        returns the shaped reward and sets self.done.
+        """
         legal_actions = self.game.state.getLegalPacmanActions()
         illegal_action = False
         if pacman_action not in legal_actions:
@@ -178,6 +392,7 @@ class PacmanEnv(gym.Env):
             pacman_action = 'Stop' # Stop is always legal
 
         reward = self.game.step(pacman_action)
+        self.observationVersion += 1
         self.cum_reward += reward
         # reward shaping for illegal actions
         if illegal_action:
@@ -187,48 +402,87 @@ class PacmanEnv(gym.Env):
 
         self.location = self.game.state.data.agentStates[0].getPosition()
         self.location_history.append(self.location)
-        self.ghostLocations = [a.getPosition() for a in self.game.state.data.agentStates[1:]]
-
         self.orientation = PACMAN_DIRECTIONS.index(self.game.state.data.agentStates[0].getDirection())
         self.orientation_history.append(self.orientation)
 
-        extent = (self.location[0] - 1, self.location[1] - 1),(self.location[0] + 1, self.location[1] + 1),
-        self.ghostInFrame = any([ g[0] >= extent[0][0] and g[1] >= extent[0][1] and g[0] <= extent[1][0] and g[1] <= extent[1][1]
-            for g in self.ghostLocations])
+        if self.info_level != 'none':
+            self.ghostLocations = [a.getPosition() for a in self.game.state.data.agentStates[1:]]
+            extent = (self.location[0] - 1, self.location[1] - 1),(self.location[0] + 1, self.location[1] + 1),
+            self.ghostInFrame = any([ g[0] >= extent[0][0] and g[1] >= extent[0][1] and g[0] <= extent[1][0] and g[1] <= extent[1][1]
+                for g in self.ghostLocations])
         self.step_counter += 1
-        info = {
-            'past_loc': [self.location_history[-2]],
-            'curr_loc': [self.location_history[-1]],
-            'past_orientation': [[self.orientation_history[-2]]],
-            'curr_orientation': [[self.orientation_history[-1]]],
-            'illegal_move_counter': [self.illegal_move_counter],
-            'step_counter': [[self.step_counter]],
-            'episode': [None],
-            'ghost_positions': [self.ghostLocations],
-            'ghost_in_frame': [self.ghostInFrame],
-        }
 
         if self.step_counter >= MAX_EP_LENGTH:
             done = True
 
         self.done = done
-
-        if self.done: # only if done, send 'episode' info
-            info['episode'] = [{
-                'r': self.cum_reward,
-                'l': self.step_counter
-            }]
-        return self._get_image(), reward, done, info
+        return reward
 
     def get_action_meanings(self):
         return [PACMAN_ACTIONS[i] for i in self._action_set]
 
+    def _observation(self, out=None):
+        if out is not None and out.shape != self._observationShape():
+            # grid observations follow the maze size
+            raise Exception('Observation buffer has shape %s, the observation %s'
+                            % (out.shape, self._observationShape()))
+        if self.lazy_observations:
+            return LazyObservation(self, out)
+        return self._get_observation(out)
+
+    def _get_observation(self, out=None):
+        # the current frame, max-pooled with the one kept by a frameskip step
+        image = self._get_image(out)
+        if self.previousFrame is not None:
+            np.maximum(image, self.previousFrame, out=image)
+        return image
+
+    def _terminalObservation(self, out=None):
+        """
+        The all-zero observation step returns once the episode is over: a
+        read-only array shared by every such step, or out zeroed.
+        """
+        if out is not None:
+            out[...] = 0
+            return out
+        shape = self._observationShape()
+        if self.terminalObservation is None or self.terminalObservation.shape != shape:
+            self.terminalObservation = np.zeros(shape, dtype=np.uint8)
+            self.terminalObservation.setflags(write=False)
+        return self.terminalObservation
+
+    def _observationShape(self):
+        # observation_space holds the whole screen in image mode
+        if self.observation_mode in GRID_OBSERVATION_MODES:
+            return self.observation_space.shape
+        return (OBSERVATION_SIZE, OBSERVATION_SIZE, 3)
+
     # just change the get image function
-    def _get_image(self):
+    def _get_image(self, out=None):
+        """
+        The observation for the current state.  With out (an array of the
+        observation's shape) it is written there and out is returned;
+        otherwise a new array is returned.
+        """
+        if self.observation_mode == 'grid':
+            return getGridObservation(self.game.state.data, out)
+        if self.observation_mode == 'egocentric_grid':
+            return getEgocentricGridObservation(self.game.state.data, EGOCENTRIC_RADIUS, out)
+        if self.observation_mode == 'egocentric':
+            # already rendered at the right size around Pacman
+            if out is None:
+                return self.display.getImage().copy()
+            np.copyto(out, self.display.getImage())
+            return out
+
         # get x, y
-        image = self.display.image
+        image = self.display.getImage()
+        self.image_sz = (OBSERVATION_SIZE, OBSERVATION_SIZE)
 
-        w, h = image.size
+        if isinstance(image, np.ndarray): # numpy renderer
+            h, w = image.shape[:2]
+        else:
+            w, h = image.size
         DEFAULT_GRID_SIZE_X, DEFAULT_GRID_SIZE_Y = w / float(self.layout.width), h / float(self.layout.height)
 
         extent = [
@@ -237,9 +491,17 @@ class PacmanEnv(gym.Env):
             DEFAULT_GRID_SIZE_X *  (self.location[0] + 2),
             DEFAULT_GRID_SIZE_Y *  (self.layout.height - (self.location[1] - 1.2))]
         extent = tuple([int(e) for e in extent])
-        self.image_sz = (84,84)
+        if isinstance(image, np.ndarray):
+            shape = (extent[3] - extent[1], extent[2] - extent[0], 3)
+            if self.cropBuffer is None or self.cropBuffer.shape != shape:
+                self.cropBuffer = np.empty(shape, dtype=np.uint8)
+                self.resizer = ImageResizer(shape, self.image_sz)
+            return self.resizer.resize(cropImage(image, extent, self.cropBuffer), out)
         image = image.crop(extent).resize(self.image_sz)
-        return np.array(image)
+        if out is None:
+            return np.array(image)
+        np.copyto(out, np.asarray(image))
+        return out
 
     def render(self, mode='human'):
         img = self._get_image()
@@ -256,6 +518,8 @@ class PacmanEnv(gym.Env):
         # TODO: implement code here to do closing stuff
         if self.viewer is not None:
             self.viewer.close()
+        if self.layoutBank is not None:
+            self.layoutBank.close()
         self.display.finish()
 
     def __del__(self):
@@ -0,0 +1,178 @@
+# pacman_subproc_env.py
+# ---------------------
+# PacmanSubprocVecEnv: PacmanVecEnv slices run in worker processes, with the
+# observations passed back through shared memory.
+
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+import os
+
+import gym
+import numpy as np
+
+from .pacman_vec_env import PacmanVecEnv
+
+
+def attachArray(name, shape, dtype):
+    """
+    Maps the shared memory block called name as an array; returns the block
+    too, since the array is only valid while it stays open.
+    """
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+def _worker(remote, parentRemote, lo, hi, seed, kwargs):
+    """
+    Runs games lo..hi-1 as a PacmanVecEnv.  Observations go into the shared
+    buffers; only actions, rewards and dones travel through the pipe.
+    """
+    parentRemote.close()
+    envs = PacmanVecEnv(hi - lo, seed=seed, **kwargs)
+    observations = envs.reset()
+    remote.send((observations.shape[1:], observations.dtype.str))
+
+    ringName, terminalName, episodesName, ringShape = remote.recv()
+    obsShape = ringShape[2:]
+    ringBlock, ring = attachArray(ringName, ringShape, observations.dtype)
+    terminalBlock, terminal = attachArray(terminalName, ringShape[1:], observations.dtype)
+    episodesBlock, episodes = attachArray(episodesName, (ringShape[1], 2), np.float64)
+    ring = ring[:, lo:hi]
+    terminal = terminal[lo:hi]
+    episodes = episodes[lo:hi]
+    ring[0] = observations
+    remote.send(None)
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                actions, slot = data
+                # rendered straight into the shared slot
+                observations, rewards, dones, info = envs.step(actions, out=ring[slot])
+                if dones.any():
+                    terminal[dones] = info['terminal_observation'][dones]
+                    episodes[dones, 0] = info['episode_r'][dones]
+                    episodes[dones, 1] = info['episode_l'][dones]
+                remote.send((rewards, dones))
+            elif cmd == 'reset':
+                envs.reset(out=ring[data])
+                remote.send(None)
+            elif cmd == 'close':
+                break
+            else:
+                raise Exception('Unknown command ' + str(cmd))
+    finally:
+        del ring, terminal, episodes
+        for block in (ringBlock, terminalBlock, episodesBlock):
+            block.close()
+        envs.close()
+        remote.close()
+
+
+class PacmanSubprocVecEnv(gym.Env):
+    """
+    num_envs games split over num_workers processes, each running its group
+    as a PacmanVecEnv.
+
+    Workers write observations straight into a shared-memory ring of
+    ring_size (num_envs, ...) arrays, and step returns the slot just written
+    without copying it: it stays valid for the next ring_size - 1 steps.
+    The final observation of an episode that just ended is in
+    info['terminal_observation'], with its return and length in
+    info['episode_r'] / info['episode_l'], all valid until the next step.
+    Keyword arguments are passed on to every PacmanEnv.
+    """
+    def __init__(self, num_envs, num_workers=None, ring_size=2, seed=None, **kwargs):
+        if num_workers is None:
+            num_workers = min(num_envs, os.cpu_count() or 1)
+        if seed is None:
+            seed = np.random.randint(2**31)
+        self.num_envs = num_envs
+        self.ringSize = ring_size
+        self.slot = 0
+        self.closed = False
+        bounds = np.linspace(0, num_envs, num_workers + 1).astype(int)
+        self.groups = [(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+        # workers share this process's tracker, which unlinks the blocks if we die
+        resource_tracker.ensure_running()
+        self.remotes, self.processes = [], []
+        for lo, hi in self.groups:
+            remote, workRemote = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_worker,
+                args=(workRemote, remote, lo, hi, seed + lo, kwargs), daemon=True)
+            process.start()
+            workRemote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+
+        shapes = [remote.recv() for remote in self.remotes]
+        if any(shape != shapes[0] for shape in shapes):
+            raise Exception('Workers disagree on the observation shape: ' + str(shapes))
+        obsShape, dtype = shapes[0]
+        dtype = np.dtype(dtype)
+        ringShape = (ring_size, num_envs) + tuple(obsShape)
+        self.blocks = [shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * itemsize))
+                       for shape, itemsize in [(ringShape, dtype.itemsize),
+                                               (ringShape[1:], dtype.itemsize),
+                                               ((num_envs, 2), 8)]]
+        self.ring = np.ndarray(ringShape, dtype=dtype, buffer=self.blocks[0].buf)
+        self.terminal = np.ndarray(ringShape[1:], dtype=dtype, buffer=self.blocks[1].buf)
+        self.episodes = np.ndarray((num_envs, 2), dtype=np.float64, buffer=self.blocks[2].buf)
+        for remote in self.remotes:
+            remote.send(tuple(block.name for block in self.blocks) + (ringShape,))
+        for remote in self.remotes:
+            remote.recv()
+
+        high = 1 if kwargs.get('observation_mode') in ('grid', 'egocentric_grid') else 255
+        self.observation_space = gym.spaces.Box(low=0, high=high, shape=tuple(obsShape), dtype=dtype)
+        self.action_space = gym.spaces.Discrete(4)
+        self.rewards = np.zeros(num_envs, dtype=np.float32)
+        self.dones = np.zeros(num_envs, dtype=bool)
+
+    def reset(self):
+        self.slot = 0
+        for remote in self.remotes:
+            remote.send(('reset', self.slot))
+        for remote in self.remotes:
+            remote.recv()
+        self.dones[:] = False
+        self.rewards[:] = 0
+        return self.ring[self.slot]
+
+    def step_async(self, actions):
+        self.slot = (self.slot + 1) % self.ringSize
+        actions = np.asarray(actions)
+        for remote, (lo, hi) in zip(self.remotes, self.groups):
+            remote.send(('step', (actions[lo:hi], self.slot)))
+
+    def step_wait(self):
+        for remote, (lo, hi) in zip(self.remotes, self.groups):
+            self.rewards[lo:hi], self.dones[lo:hi] = remote.recv()
+        info = {
+            'terminal_observation': self.terminal,
+            'episode_r': self.episodes[:, 0],
+            'episode_l': self.episodes[:, 1],
+        }
+        return self.ring[self.slot], self.rewards, self.dones, info
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for process in self.processes:
+            process.join()
+        del self.ring, self.terminal, self.episodes
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+    def __del__(self):
+        if hasattr(self, 'blocks'):
+            self.close()
@@ -0,0 +1,107 @@
+# pacman_vec_env.py
+# -----------------
+# PacmanVecEnv: several PacmanEnv games stepped in lockstep, written into
+# arrays allocated once.
+
+import gym
+from gym import spaces
+import numpy as np
+
+from .pacman_env import PacmanEnv, PACMAN_ACTIONS, INFO_DTYPE, GRID_OBSERVATION_MODES
+
+
+class PacmanVecEnv(gym.Env):
+    """
+    num_envs PacmanEnv games stepped in lockstep.
+
+    Each slot's game is built by PacmanEnv.reset and played by the same
+    moves as PacmanEnv.step, but observations, rewards, dones and the info
+    columns are written into arrays allocated once, and the info dicts of
+    PacmanEnv.step are skipped.  Games
+    reset themselves when they end; the last observation of the finished
+    episode is kept in info['terminal_observation'], and its return and
+    length in info['episode_r'] / info['episode_l']; the other info columns
+    of a reset game already describe its new episode.  The info columns are
+    the fields of one INFO_DTYPE array (info_array), whose rows are the
+    games' PacmanEnv.infoRecord; with info_level='none' the ghost columns
+    are not kept up to date.
+
+    The arrays returned by reset and step are reused on the next call, so
+    copy them if you need to keep them; or pass out, a (num_envs, ...)
+    array the observations are rendered straight into.  Keyword arguments
+    are passed on to every PacmanEnv.
+    """
+    def __init__(self, num_envs, seed=None, **kwargs):
+        self.num_envs = num_envs
+        self.envs = [PacmanEnv(**kwargs) for _ in range(num_envs)]
+        self.seed(seed)
+        env = self.envs[0]
+        self.action_space = env.action_space
+        # seeding chose each env's first layout, which fixes the grid size
+        env.setObservationSpace()
+        high = 1 if env.observation_mode in GRID_OBSERVATION_MODES else 255
+        self.observation_space = spaces.Box(low=0, high=high,
+            shape=env._observationShape(), dtype=np.uint8)
+        self.observations = None
+        self.rewards = np.zeros(num_envs, dtype=np.float32)
+        self.dones = np.zeros(num_envs, dtype=bool)
+        self.info_array = np.zeros(num_envs, dtype=INFO_DTYPE)
+        for i, env in enumerate(self.envs):
+            env.infoRecord = self.info_array[i, ...] # resets write straight into the row
+        self.info = dict((name, self.info_array[name]) for name in INFO_DTYPE.names)
+        self.info['terminal_observation'] = None
+
+    def seed(self, seed=None):
+        # env.seed also drops the env's layout bank, drawn from the old stream
+        if seed is None:
+            seed = np.random.randint(2**31)
+        seeds = [int(seed + i) % 2**32 for i in range(self.num_envs)]
+        for env, envSeed in zip(self.envs, seeds):
+            env.seed(envSeed)
+        return seeds
+
+    def reset(self, out=None):
+        for i in range(self.num_envs):
+            self._resetEnv(i, out)
+        self.dones[:] = False
+        self.rewards[:] = 0
+        return self.observations if out is None else out
+
+    def _resetEnv(self, i, out=None):
+        env = self.envs[i]
+        if self.observations is None:
+            observation = np.asarray(env.reset()) # may be a LazyObservation
+            self.observations = np.zeros((self.num_envs,) + observation.shape, dtype=observation.dtype)
+            self.info['terminal_observation'] = np.zeros_like(self.observations)
+            (self.observations if out is None else out)[i] = observation
+        else:
+            # raises if the maze size, and so the grid observation's, changed
+            observations = self.observations if out is None else out
+            np.asarray(env.reset(out=observations[i])) # renders a LazyObservation into place
+        # env.reset filled in the info, its infoRecord being row i
+
+    def step(self, actions, out=None):
+        info = self.info
+        observations = self.observations if out is None else out
+        for i, env in enumerate(self.envs):
+            # the moves of PacmanEnv.step; the info goes straight into row i
+            self.rewards[i], steps = env._repeatAction(PACMAN_ACTIONS[actions[i]])
+            env._fillInfoRecord(steps)
+            self.dones[i] = env.done
+
+        for i, env in enumerate(self.envs):
+            if self.dones[i]:
+                env._get_observation(info['terminal_observation'][i])
+                episode = info['episode_r'][i], info['episode_l'][i]
+                self._resetEnv(i, out) # clears the row's episode fields
+                info['episode_r'][i], info['episode_l'][i] = episode
+            else:
+                env._get_observation(observations[i])
+        return observations, self.rewards, self.dones, info
+
+    def get_action_meanings(self):
+        return self.envs[0].get_action_meanings()
+
+    def close(self):
+        for env in self.envs:
+            env.close()
@@ -30,6 +30,9 @@ class NullGraphics:
     def update(self, state):
         pass
 
+    def updateView(self):
+        pass
+
     def checkNullDisplay(self):
         return True
 